@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+""" This script load tests the API and reports throughput per concurrency level
+
+It sends the same request many times from a pool of threads.
+It runs either against a server over HTTP or in-process with the Flask test client.
+It prints requests per second and latency percentiles for each concurrency level.
+
+Examples:
+    python benchmarks/load_test.py --in-process --path /get-source-file-list
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --path /evaluate-file \
+        --method POST --file target.pdf --concurrency 1,2,4,8
+
+"""
+
+import argparse
+import mimetypes
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from statistics import quantiles
+from time import perf_counter
+from typing import Callable, List, Optional, Tuple
+from urllib import error, request as urlrequest
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+
+def parse_options():
+    """Parse command-line arguments for the load test"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url", type=str, default="http://127.0.0.1:8000", help="server base url"
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="call the Flask app directly instead of going through HTTP",
+    )
+    parser.add_argument(
+        "--path", type=str, default="/get-source-file-list", help="endpoint path"
+    )
+    parser.add_argument("--method", type=str, default="GET", help="HTTP method")
+    parser.add_argument(
+        "--file", type=str, help="file sent as multipart `file` field with each request"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=str,
+        default="1,2,4,8",
+        help="comma separated concurrency levels (default=1,2,4,8)",
+    )
+    parser.add_argument(
+        "-n",
+        "--requests",
+        type=int,
+        default=50,
+        help="number of requests per concurrency level (default=50)",
+    )
+
+    return parser.parse_args()
+
+
+def build_multipart(file_path: str) -> Tuple[bytes, str]:
+    """Return multipart body and content type uploading file_path as `file`"""
+
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    with open(file_path, "rb") as file:
+        content = file.read()
+
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; '
+        f'filename="{path.basename(file_path)}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def http_sender(
+    url: str, method: str, body: Optional[bytes], content_type: Optional[str]
+) -> Callable[[], int]:
+    """Return function sending one HTTP request and returning its status code"""
+
+    def send() -> int:
+        req = urlrequest.Request(url, data=body, method=method)
+        if content_type:
+            req.add_header("Content-Type", content_type)
+        try:
+            with urlrequest.urlopen(req) as response:
+                response.read()
+                return response.status
+        except error.HTTPError as http_error:
+            return http_error.code
+
+    return send
+
+
+def in_process_sender(
+    endpoint: str, method: str, body: Optional[bytes], content_type: Optional[str]
+) -> Callable[[], int]:
+    """Return function calling the Flask app directly and returning its status code"""
+
+    from main import app
+
+    def send() -> int:
+        client = app.test_client()
+        response = client.open(
+            endpoint, method=method, data=body, content_type=content_type
+        )
+        response.get_data()
+        return response.status_code
+
+    return send
+
+
+def run_level(send: Callable[[], int], concurrency: int, total: int) -> dict:
+    """Send total requests with concurrency threads and return measurements"""
+
+    def timed() -> Tuple[int, float]:
+        start = perf_counter()
+        status = send()
+        return status, perf_counter() - start
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: timed(), range(total)))
+    elapsed = perf_counter() - start
+
+    latencies: List[float] = sorted(latency for _, latency in results)
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(1 for status, _ in results if status >= 400),
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50": percentiles[49],
+        "p95": percentiles[94],
+    }
+
+
+def main() -> None:
+    args = parse_options()
+
+    body, content_type = (
+        build_multipart(args.file) if args.file else (None, None)
+    )
+    method = args.method.upper()
+    if args.in_process:
+        send = in_process_sender(args.path, method, body, content_type)
+    else:
+        send = http_sender(args.url.rstrip("/") + args.path, method, body, content_type)
+
+    print(
+        f"{'concurrency':>12}{'requests':>10}{'errors':>8}"
+        f"{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for level in [int(c) for c in args.concurrency.split(",")]:
+        stats = run_level(send, level, args.requests)
+        print(
+            f"{stats['concurrency']:>12}{stats['requests']:>10}{stats['errors']:>8}"
+            f"{stats['throughput']:>10.2f}{stats['p50'] * 1000:>10.1f}"
+            f"{stats['p95'] * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+""" This script measures text preprocessing throughput in MB/s
+
+It compares the per-format extractors used before the preprocessing pipeline
+(copied below) with the pipeline of `scripts/preprocessing.py`, returning words as
+document mode does or token hashes as windowed mode does. It runs on generated txt
+and docx files or on given files of any supported format. MB are file sizes, so
+compressed for docx.
+
+Examples:
+    python benchmarks/preprocessing_throughput.py --size 20
+    python benchmarks/preprocessing_throughput.py --files paper.pdf thesis.odt
+
+"""
+
+import argparse
+import gc
+import random
+import re
+import shutil
+import sys
+import tempfile
+import zipfile
+from os import path
+from statistics import median
+from time import perf_counter
+from typing import Callable, List
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from scripts.preprocessing import Preprocessor  # noqa: E402
+from scripts.processing_files import (  # noqa: E402
+    get_file_extension,
+    iter_file_text,
+)
+
+
+def legacy_pdf_words(pdf_path: str) -> list:
+    """Return words of pdf file as extracted before the pipeline"""
+
+    from pdfminer.high_level import extract_text
+
+    cleaned_text = re.sub(r"\s+", " ", extract_text(pdf_path))
+    cleaned_text = re.sub(r"<(.|\n)*?>", "", cleaned_text)
+
+    return re.findall(r"\w+", cleaned_text.lower())
+
+
+def legacy_txt_words(txt_path: str) -> list:
+    """Return words of txt file as extracted before the pipeline"""
+
+    words = []
+    with open(txt_path, encoding="utf-8") as file:
+        for line in file:
+            for word in line.split():
+                words.append(word.lower())
+
+    return re.findall(r"\w+", " ".join(map(str, words)))
+
+
+def legacy_docx_words(docx_path: str) -> list:
+    """Return words of docx file as extracted before the pipeline"""
+
+    with zipfile.ZipFile(docx_path) as docx:
+        content = docx.read("word/document.xml").decode("utf-8")
+        cleaned = re.sub("<(.|\n)*?>", "", content)
+
+    return re.findall(r"\w+", cleaned.lower())
+
+
+def legacy_odt_words(odt_path: str) -> list:
+    """Return words of odt file as extracted before the pipeline"""
+
+    from odf import teletype, text
+    from odf.opendocument import load
+
+    full_text = str()
+    for paragraph in load(odt_path).getElementsByType(text.P):
+        full_text += teletype.extractText(paragraph).lower()
+
+    return re.findall(r"\w+", full_text)
+
+
+LEGACY_EXTRACTORS = {
+    ".pdf": legacy_pdf_words,
+    ".txt": legacy_txt_words,
+    ".docx": legacy_docx_words,
+    ".odt": legacy_odt_words,
+}
+
+
+def parse_options():
+    """Parse command-line arguments for the throughput benchmark"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="*", default=[], help="files to preprocess")
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=10,
+        help="MB of generated txt and docx text when no --files (default=10)",
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=3, help="runs per extractor (default=3)"
+    )
+
+    return parser.parse_args()
+
+
+def generate_text(size: int) -> str:
+    """Return about size bytes of text mixing accents, numbers and punctuation"""
+
+    random.seed(0)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    vocabulary += ["Résumé", "naïve", "Straße", "ﬁnal", "2024", "3.14", "e-mail"]
+    paragraphs, length = [], 0
+    while length < size:
+        paragraph = " ".join(random.choices(vocabulary, k=120)) + "."
+        paragraphs.append(paragraph)
+        length += len(paragraph.encode("utf-8")) + 1
+
+    return "\n".join(paragraphs)
+
+
+def write_generated_files(directory: str, size: int) -> List[str]:
+    """Write a txt and a docx file with size bytes of text, return their paths"""
+
+    content = generate_text(size)
+    txt_path = path.join(directory, "generated.txt")
+    with open(txt_path, "w", encoding="utf-8") as file:
+        file.write(content)
+
+    document = "".join(
+        f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>"
+        for paragraph in content.split("\n")
+    )
+    docx_path = path.join(directory, "generated.docx")
+    with zipfile.ZipFile(docx_path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr(
+            "word/document.xml",
+            f'<?xml version="1.0" encoding="UTF-8"?><w:document><w:body>{document}'
+            "</w:body></w:document>",
+        )
+
+    return [txt_path, docx_path]
+
+
+def time_extractor(extract: Callable[[str], object], file_path: str, repeat: int):
+    """Return median duration of extract on file_path and its last output
+
+    Like timeit, garbage collection is disabled while timing, as its cost depends on
+    the objects left alive by previous runs.
+
+    """
+
+    durations, output = [], None
+    for _ in range(repeat):
+        output = None
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            output = extract(file_path)
+            durations.append(perf_counter() - start)
+        finally:
+            gc.enable()
+
+    return median(durations), output
+
+
+def main() -> None:
+    args = parse_options()
+
+    work_dir = None
+    files = args.files
+    if not files:
+        work_dir = tempfile.mkdtemp(prefix="preprocessing_")
+        files = write_generated_files(work_dir, args.size * 1024 * 1024)
+
+    pipeline = Preprocessor()
+
+    def pipeline_words(file_path: str) -> list:
+        return pipeline.words(iter_file_text(file_path))
+
+    def pipeline_hashes(file_path: str):
+        return pipeline.hashes(iter_file_text(file_path))
+
+    try:
+        print(
+            f"{'file':>24}{'MB':>8}{'legacy MB/s':>14}{'words MB/s':>13}"
+            f"{'hashes MB/s':>14}{'words':>11}{'same words':>12}"
+        )
+        for file_path in files:
+            size = path.getsize(file_path) / (1024 * 1024)
+            legacy = LEGACY_EXTRACTORS[get_file_extension(file_path)]
+            legacy_time, legacy_words = time_extractor(legacy, file_path, args.repeat)
+            words_time, words = time_extractor(pipeline_words, file_path, args.repeat)
+            hashes_time, _ = time_extractor(pipeline_hashes, file_path, args.repeat)
+            same = sum(a == b for a, b in zip(legacy_words, words))
+            print(
+                f"{path.basename(file_path)[-24:]:>24}{size:>8.1f}"
+                f"{size / legacy_time:>14.1f}{size / words_time:>13.1f}"
+                f"{size / hashes_time:>14.1f}{len(words):>11}"
+                f"{same / max(1, len(legacy_words)):>12.1%}"
+            )
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
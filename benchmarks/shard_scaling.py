@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+""" This script measures how evaluate-file scales with the number of shards
+
+For each shard count, it splits a corpus of source files between that many local
+shard servers, starts a coordinator in front of them, then times evaluate-file.
+Every server is a separate `serve.py` process with its own port and directories.
+
+Examples:
+    python benchmarks/shard_scaling.py --target target.pdf --corpus source_files
+    python benchmarks/shard_scaling.py --synthetic 200 --shards 1,2,4
+
+"""
+
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from os import environ, listdir, makedirs, path
+from statistics import median
+from time import perf_counter, sleep
+from typing import List
+from urllib import error, request as urlrequest
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchmarks.load_test import build_multipart  # noqa: E402
+
+SERVE_SCRIPT = path.join(path.dirname(path.dirname(path.abspath(__file__))), "serve.py")
+
+
+def parse_options():
+    """Parse command-line arguments for the scaling benchmark"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=str, help="directory of source files")
+    parser.add_argument("--target", type=str, help="file to evaluate")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="generate this many random text sources instead of using --corpus",
+    )
+    parser.add_argument(
+        "--shards", type=str, default="1,2,4", help="shard counts (default=1,2,4)"
+    )
+    parser.add_argument(
+        "-n", "--requests", type=int, default=3, help="requests per shard count"
+    )
+    parser.add_argument(
+        "--base-port", type=int, default=8100, help="first port used (default=8100)"
+    )
+
+    return parser.parse_args()
+
+
+def write_synthetic_corpus(directory: str, count: int, words: int = 3000) -> str:
+    """Write count random text files to directory and return a matching target"""
+
+    random.seed(0)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    makedirs(directory)
+    for ind in range(count):
+        text = " ".join(random.choice(vocabulary) for _ in range(words))
+        with open(path.join(directory, f"source{ind:05d}.txt"), "w") as file:
+            file.write(text)
+
+    target_path = path.join(path.dirname(directory), "target.txt")
+    with open(path.join(directory, "source00000.txt")) as file:
+        copied = file.read().split()[:500]
+    with open(target_path, "w") as file:
+        file.write(" ".join(copied + random.choices(vocabulary, k=1000)))
+
+    return target_path
+
+
+def start_server(work_dir: str, port: int, extra_env: dict) -> subprocess.Popen:
+    """Start a single worker server in work_dir listening on port"""
+
+    env = {**environ, "PLAG_RESULTS_SWEEP_INTERVAL": "0", **extra_env}
+    return subprocess.Popen(
+        [sys.executable, SERVE_SCRIPT, "-w", "1", "-b", f"127.0.0.1:{port}"],
+        cwd=work_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(port: int, timeout: float = 60) -> None:
+    """Wait for server on port to answer the file list endpoint"""
+
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            with urlrequest.urlopen(
+                f"http://127.0.0.1:{port}/get-source-file-list?limit=1"
+            ):
+                return
+        except (error.URLError, OSError):
+            sleep(0.2)
+
+    raise TimeoutError(f"Server on port {port} did not start")
+
+
+def run_shard_count(
+    shard_count: int, corpus: str, target: str, requests: int, base_port: int
+) -> float:
+    """Return median evaluate-file duration with corpus split in shard_count shards"""
+
+    root = tempfile.mkdtemp(prefix=f"shards{shard_count}_")
+    processes: List[subprocess.Popen] = []
+    files = sorted(listdir(corpus))
+
+    try:
+        shard_urls = []
+        for shard in range(shard_count):
+            shard_dir = path.join(root, f"shard{shard}")
+            makedirs(path.join(shard_dir, "source_files"))
+            for file_name in files[shard::shard_count]:
+                shutil.copy(
+                    path.join(corpus, file_name),
+                    path.join(shard_dir, "source_files", file_name),
+                )
+            port = base_port + 1 + shard
+            processes.append(start_server(shard_dir, port, {}))
+            shard_urls.append(f"http://127.0.0.1:{port}")
+
+        coordinator_dir = path.join(root, "coordinator")
+        makedirs(coordinator_dir)
+        processes.append(
+            start_server(
+                coordinator_dir,
+                base_port,
+                {"PLAG_SHARD_URLS": json.dumps(shard_urls)},
+            )
+        )
+        for port in range(base_port, base_port + shard_count + 1):
+            wait_until_ready(port)
+
+        body, content_type = build_multipart(target)
+        durations = []
+        for _ in range(requests):
+            req = urlrequest.Request(
+                f"http://127.0.0.1:{base_port}/evaluate-file", data=body, method="POST"
+            )
+            req.add_header("Content-Type", content_type)
+            start = perf_counter()
+            with urlrequest.urlopen(req) as response:
+                report = json.load(response)
+            durations.append(perf_counter() - start)
+
+        failed = [s for s in report["shards"] if s["status"] != "ok"]
+        if failed:
+            raise RuntimeError(f"Shards failed: {failed}")
+
+        return median(durations)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main() -> None:
+    args = parse_options()
+
+    work_dir = None
+    corpus, target = args.corpus, args.target
+    if args.synthetic:
+        work_dir = tempfile.mkdtemp(prefix="shard_corpus_")
+        corpus = path.join(work_dir, "corpus")
+        target = write_synthetic_corpus(corpus, args.synthetic)
+    if not corpus or not target:
+        sys.exit("Give --corpus and --target, or --synthetic")
+
+    try:
+        baseline = None
+        print(f"{'shards':>8}{'median s':>12}{'speedup':>10}")
+        for shard_count in [int(c) for c in args.shards.split(",")]:
+            duration = run_shard_count(
+                shard_count, corpus, target, args.requests, args.base_port
+            )
+            baseline = baseline or duration
+            print(f"{shard_count:>8}{duration:>12.3f}{baseline / duration:>10.2f}")
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
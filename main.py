@@ -1,20 +1,141 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+import math
 import os
-from scripts.file_comparison import compare
+import uuid
+from werkzeug.serving import is_running_from_reloader
+from scripts import catalog, preprocessing, profiling, retention, sharding, uploads
+from scripts.file_comparison import (
+    MinimumFilesError,
+    UnsupportedFileError,
+    compare,
+    compare_windowed,
+    iter_compare,
+    prepare_comparison,
+    read_target,
+    score_sources,
+)
+from scripts.streaming import STREAM_FORMATS, stream_results
+from scripts.concurrency import limit_concurrency
+from scripts.deadline import Deadline
 from scripts.utils import human_readable_size
 from flask import send_file
+import gzip
+import shutil
 import zipfile
 import io
 
 app = Flask(__name__)
 
-target_dir = "target_files"
-source_dir = "source_files"
-output_dir = "results"
-block_size = 2
+# Defaults, each one can be overridden with a PLAG_ prefixed environment variable,
+# e.g. PLAG_MAX_CONTENT_LENGTH=104857600 or PLAG_EVALUATE_CONCURRENCY=4
+app.config.from_mapping(
+    TARGET_DIR="target_files",
+    SOURCE_DIR="source_files",
+    OUTPUT_DIR="results",
+    BLOCK_SIZE=2,
+    # SQLite database indexing the files of SOURCE_DIR
+    CATALOG_PATH="catalog.sqlite3",
+    # Default and largest number of entries per page of the source file list
+    LIST_PAGE_SIZE=1000,
+    # Partial files of chunked uploads, keep it on the same disk as SOURCE_DIR
+    UPLOAD_DIR="upload_parts",
+    # Seconds after which an untouched chunked upload is discarded
+    UPLOAD_EXPIRY=24 * 60 * 60,
+    # Windowed mode of evaluate-file: words per window (windows overlap by half),
+    # lowest window similarity counted as a hit and processes scoring windows.
+    # These processes also compare long documents as a whole in document mode
+    SEGMENT_WINDOW_SIZE=50,
+    SEGMENT_THRESHOLD=50,
+    SEGMENT_WORKERS=2,
+    # Normalization of extracted text: numbers kept, masked as "0" or dropped,
+    # accents stripped and English stop words dropped. Shards of a coordinator and
+    # documents compared together must share these settings
+    TOKEN_NUMBERS="keep",
+    TOKEN_STRIP_ACCENTS=False,
+    TOKEN_STOP_WORDS=False,
+    # Results older than RESULTS_MAX_AGE seconds are deleted, then the oldest ones
+    # while all results exceed RESULTS_MAX_SIZE bytes, every RESULTS_SWEEP_INTERVAL
+    # seconds. 0 disables a limit or the sweeper
+    RESULTS_MAX_AGE=30 * 24 * 60 * 60,
+    RESULTS_MAX_SIZE=5 * 1024 * 1024 * 1024,
+    RESULTS_SWEEP_INTERVAL=60 * 60,
+    # Coordinator mode: base urls of the shards (JSON list or comma separated) which
+    # evaluate-file fans out to, number of merged results kept and shard timeout
+    SHARD_URLS=[],
+    SHARD_TOP_K=20,
+    SHARD_TIMEOUT=300,
+    # Profiling of evaluate-file: allow profiling requests sent with an X-Profile: 1
+    # header or profile=1 query parameter, and profile 1 in PROFILE_SAMPLE_RATE
+    # requests automatically (0 disables sampling)
+    PROFILING_ENABLED=False,
+    PROFILE_SAMPLE_RATE=0,
+    # Seconds an evaluate-file request may take by default, and at most when asked
+    # with its timeout parameter. Sources not compared in time are skipped
+    EVALUATE_TIMEOUT=120,
+    MAX_EVALUATE_TIMEOUT=600,
+    # Largest accepted request body in bytes (uploads included)
+    MAX_CONTENT_LENGTH=50 * 1024 * 1024,
+    # Simultaneous heavy requests allowed per worker process, extra ones get a 503.
+    # Together they stay below the server threads, left for light endpoints
+    EVALUATE_CONCURRENCY=2,
+    UPLOAD_CONCURRENCY=1,
+)
+app.config.from_prefixed_env("PLAG")
+
+target_dir = app.config["TARGET_DIR"]
+source_dir = app.config["SOURCE_DIR"]
+output_dir = app.config["OUTPUT_DIR"]
+block_size = app.config["BLOCK_SIZE"]
+catalog_path = app.config["CATALOG_PATH"]
+upload_dir = app.config["UPLOAD_DIR"]
+shard_urls = sharding.parse_shard_urls(app.config["SHARD_URLS"])
+# Each limit is shared by all the endpoints of its kind
+limit_evaluations = limit_concurrency(app.config["EVALUATE_CONCURRENCY"])
+limit_uploads = limit_concurrency(app.config["UPLOAD_CONCURRENCY"])
+preprocessing.configure(
+    app.config["TOKEN_NUMBERS"],
+    app.config["TOKEN_STRIP_ACCENTS"],
+    app.config["TOKEN_STOP_WORDS"],
+)
+
+if not os.path.exists(source_dir):
+    os.makedirs(source_dir)
+
+
+def start_background_tasks() -> None:
+    """Sync the catalog and start the results sweeper, once per server
+
+    Called by the dev server below and by the gunicorn master in serve.py, never on
+    import, as worker processes and spawned scoring processes import this module.
+
+    """
+
+    # Pick up files copied into source_dir while the server was down
+    catalog.sync_directory(catalog_path, source_dir)
+
+    if app.config["RESULTS_SWEEP_INTERVAL"]:
+        retention.start_sweeper(
+            output_dir,
+            app.config["RESULTS_SWEEP_INTERVAL"],
+            app.config["RESULTS_MAX_AGE"],
+            app.config["RESULTS_MAX_SIZE"],
+        )
+
+
+@app.before_request
+def check_content_length():
+    """Reject oversized bodies before a view starts reading them"""
+
+    max_length = app.config["MAX_CONTENT_LENGTH"]
+    if max_length and request.content_length and request.content_length > max_length:
+        return (
+            jsonify({"error": f"Request body exceeds {max_length} bytes limit"}),
+            413,
+        )
 
 
 @app.route("/evaluate-file", methods=["POST"])
+@limit_evaluations
 def evaluate_file():
     try:
         if "file" not in request.files:
@@ -24,14 +145,211 @@ def evaluate_file():
         if file.filename == "":
             return jsonify({"error": "No selected file"}), 400
 
-        target_dir = "target_files"
         if not os.path.exists(target_dir):
             os.makedirs(target_dir)
 
-        file_path = os.path.join(target_dir, file.filename)
-        file.save(file_path)
+        mode = request.values.get("mode", "document")
+        if mode not in ("document", "windowed"):
+            return jsonify({"error": "Mode must be document or windowed"}), 400
 
-        return compare(file_path, source_dir, output_dir, block_size)
+        try:
+            window_size = int(
+                request.values.get("window_size", app.config["SEGMENT_WINDOW_SIZE"])
+            )
+        except ValueError:
+            return jsonify({"error": "Window size must be an integer"}), 400
+        if window_size < 1:
+            return jsonify({"error": "Window size must be positive"}), 400
+
+        stream_format = request.values.get("stream")
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return jsonify({"error": "Stream must be ndjson or sse"}), 400
+        if stream_format and mode == "windowed":
+            return (
+                jsonify({"error": "Streaming is only available in document mode"}),
+                400,
+            )
+
+        order = request.values.get("order", "catalog")
+        if order not in ("catalog", "best-first"):
+            return jsonify({"error": "Order must be catalog or best-first"}), 400
+
+        top_k = request.values.get("top_k")
+        if top_k is not None:
+            # Shards always return their best results, locally it needs the ranking
+            if order != "best-first" and not shard_urls:
+                return jsonify({"error": "Top k requires best-first order"}), 400
+            try:
+                top_k = int(top_k)
+            except ValueError:
+                return jsonify({"error": "Top k must be an integer"}), 400
+            if top_k < 1:
+                return jsonify({"error": "Top k must be positive"}), 400
+
+        try:
+            timeout = float(
+                request.values.get("timeout", app.config["EVALUATE_TIMEOUT"])
+            )
+        except ValueError:
+            return jsonify({"error": "Timeout must be a number of seconds"}), 400
+        if not math.isfinite(timeout) or timeout <= 0:
+            return jsonify({"error": "Timeout must be a positive, finite number"}), 400
+        deadline = Deadline(min(timeout, app.config["MAX_EVALUATE_TIMEOUT"]))
+
+        if shard_urls and (stream_format or mode == "windowed"):
+            return (
+                jsonify({"error": "Only document mode is available on shards"}),
+                400,
+            )
+
+        # Each request saves its target in a directory of its own, named after the
+        # client file, with the extension of the type detected from its content
+        request_dir = os.path.join(target_dir, uuid.uuid4().hex)
+        tmp_path, _ = uploads.save_stream(file.stream, request_dir)
+        try:
+            file_type = uploads.detect_file_type(tmp_path)
+            if file_type is None:
+                error = f"{file.filename} is not a txt, pdf, docx or odt file"
+                return jsonify({"error": error}), 400
+            target_name = uploads.source_file_name(file.filename, file_type)
+            file_path = os.path.join(request_dir, target_name)
+            os.replace(tmp_path, file_path)
+
+            if stream_format:
+                try:
+                    target_file_text, source_entries = prepare_comparison(
+                        file_path, catalog_path
+                    )
+                except (UnsupportedFileError, MinimumFilesError) as e:
+                    return jsonify({"error": str(e)}), 400
+
+                results = iter_compare(
+                    file_path,
+                    target_file_text,
+                    source_entries,
+                    source_dir,
+                    output_dir,
+                    block_size,
+                    catalog_path,
+                    order == "best-first",
+                    top_k,
+                    deadline,
+                    app.config["SEGMENT_WORKERS"],
+                )
+                return Response(
+                    stream_with_context(
+                        stream_results(target_name, results, stream_format)
+                    ),
+                    mimetype=STREAM_FORMATS[stream_format],
+                    # Keep proxies from buffering the stream
+                    headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+                )
+
+            def evaluate():
+                if shard_urls:
+                    try:
+                        target_file_text = read_target(file_path)
+                    except UnsupportedFileError as e:
+                        return jsonify({"error": str(e)}), 400
+
+                    report = sharding.coordinate(
+                        target_name,
+                        target_file_text,
+                        shard_urls,
+                        output_dir,
+                        top_k or app.config["SHARD_TOP_K"],
+                        app.config["SHARD_TIMEOUT"],
+                        deadline,
+                    )
+                    # No shard could answer, the empty report is not a result
+                    if all(shard["status"] == "failed" for shard in report["shards"]):
+                        return jsonify(report), 502
+                    return jsonify(report), 200
+
+                if mode == "windowed":
+                    return compare_windowed(
+                        file_path,
+                        source_dir,
+                        catalog_path,
+                        window_size,
+                        max(1, window_size // 2),
+                        app.config["SEGMENT_THRESHOLD"],
+                        app.config["SEGMENT_WORKERS"],
+                        deadline=deadline,
+                    )
+
+                return compare(
+                    file_path,
+                    source_dir,
+                    output_dir,
+                    block_size,
+                    catalog_path,
+                    order == "best-first",
+                    top_k,
+                    deadline,
+                    app.config["SEGMENT_WORKERS"],
+                )
+
+            profile_requested = "1" in (
+                request.headers.get("X-Profile"),
+                request.args.get("profile"),
+            )
+            if profiling.should_profile(
+                profile_requested,
+                app.config["PROFILING_ENABLED"],
+                app.config["PROFILE_SAMPLE_RATE"],
+            ):
+                return profiling.profiled_response(evaluate, output_dir)
+
+            return evaluate()
+        finally:
+            # Targets are read before the response is returned, even when streamed
+            shutil.rmtree(request_dir, ignore_errors=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/shard/score", methods=["POST"])
+@limit_evaluations
+def shard_score():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("words"), list):
+            return jsonify({"error": "No target words provided"}), 400
+        if not all(isinstance(word, str) for word in data["words"]):
+            return jsonify({"error": "Target words must be strings"}), 400
+
+        top_k = data.get("top_k")
+        candidates = data.get("candidates")
+        for value in (top_k, candidates):
+            if value is not None and (
+                not isinstance(value, int) or isinstance(value, bool) or value < 1
+            ):
+                return jsonify({"error": "Invalid top_k or candidates"}), 400
+
+        timeout = data.get("timeout", app.config["EVALUATE_TIMEOUT"])
+        if (
+            not isinstance(timeout, (int, float))
+            or isinstance(timeout, bool)
+            or not math.isfinite(timeout)
+            or timeout <= 0
+        ):
+            return jsonify({"error": "Timeout must be a positive, finite number"}), 400
+        deadline = Deadline(min(timeout, app.config["MAX_EVALUATE_TIMEOUT"]))
+
+        compared, results, skipped = score_sources(
+            data["words"],
+            source_dir,
+            catalog_path,
+            top_k,
+            candidates,
+            deadline,
+            app.config["SEGMENT_WORKERS"],
+        )
+        return (
+            jsonify({"compared": compared, "skipped": skipped, "results": results}),
+            200,
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -40,31 +358,37 @@ def evaluate_file():
 def get_file_list():
 
     try:
-        if not os.path.exists(source_dir):
-            os.makedirs(source_dir)
-
-        file_list = sorted(os.listdir(source_dir))
-        file_objects = []
-        for idx, file_name in enumerate(file_list):
-            file_path = os.path.join(source_dir, file_name)
-            file_extension = os.path.splitext(file_name)[1][1:].upper()
-            file_size = os.path.getsize(file_path)
-            file_size = human_readable_size(file_size)
-            file_objects.append(
-                {
-                    "id": idx + 1,
-                    "file_name": file_name,
-                    "file_extension": file_extension,
-                    "file_size": file_size,
-                }
-            )
-
-        return jsonify(file_objects), 200
+        page_size = app.config["LIST_PAGE_SIZE"]
+        try:
+            offset = int(request.args.get("offset", 0))
+            limit = min(int(request.args.get("limit", page_size)), page_size)
+        except ValueError:
+            return jsonify({"error": "Offset and limit must be integers"}), 400
+        if offset < 0 or limit < 1:
+            return jsonify({"error": "Invalid offset or limit"}), 400
+
+        file_objects = [
+            {
+                "id": entry["id"],
+                "file_name": entry["file_name"],
+                "file_extension": entry["file_extension"].upper(),
+                "file_size": human_readable_size(entry["file_size"]),
+                "sha256": entry["sha256"],
+                "status": entry["status"],
+                "token_count": entry["token_count"],
+            }
+            for entry in catalog.list_sources(catalog_path, offset, limit)
+        ]
+
+        response = jsonify(file_objects)
+        response.headers["X-Total-Count"] = str(catalog.count_sources(catalog_path))
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/upload-source-files", methods=["POST"])
+@limit_uploads
 def store_files():
     try:
         if "files" not in request.files:
@@ -74,21 +398,19 @@ def store_files():
         if not files:
             return jsonify({"error": "At least one file is required"}), 400
 
-        allowed_extensions = {"pdf", "txt", "docx", "odt"}
-        if not os.path.exists(source_dir):
-            os.makedirs(source_dir)
-
         stored_files_count = 0
         rejected_files_count = 0
 
         for file in files:
-            file_extension = file.filename.rsplit(".", 1)[1].lower()
-            if file_extension not in allowed_extensions:
+            tmp_path, sha256 = uploads.save_stream(file.stream, upload_dir)
+            try:
+                uploads.commit_to_sources(
+                    tmp_path, file.filename, sha256, source_dir, catalog_path
+                )
+            except uploads.UnsupportedFileTypeError:
                 rejected_files_count += 1
                 continue
 
-            file_path = os.path.join(source_dir, file.filename)
-            file.save(file_path)
             stored_files_count += 1
 
         message_parts = []
@@ -106,6 +428,85 @@ def store_files():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/uploads", methods=["POST"])
+def create_upload():
+    try:
+        data = request.get_json(silent=True)
+        if not data or not data.get("file_name"):
+            return jsonify({"error": "No file name provided"}), 400
+
+        total_size = data.get("total_size")
+        if total_size is not None and (
+            not isinstance(total_size, int) or total_size < 1
+        ):
+            return jsonify({"error": "Total size must be a positive integer"}), 400
+
+        uploads.purge_stale_uploads(upload_dir, app.config["UPLOAD_EXPIRY"])
+        session = uploads.create_upload(upload_dir, data["file_name"], total_size)
+        return jsonify(session), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    try:
+        return jsonify(uploads.get_upload(upload_dir, upload_id)), 200
+    except uploads.UploadNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/uploads/<upload_id>", methods=["PATCH"])
+@limit_uploads
+def append_upload_chunk(upload_id):
+    try:
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return jsonify({"error": "Upload-Offset header must be an integer"}), 400
+
+        session = uploads.append_chunk(upload_dir, upload_id, offset, request.stream)
+        return jsonify(session), 200
+    except uploads.UploadNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except uploads.UploadOffsetError as e:
+        return jsonify({"error": str(e), "offset": e.expected_offset}), 409
+    except uploads.IncompleteUploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/uploads/<upload_id>/complete", methods=["POST"])
+@limit_uploads
+def complete_upload(upload_id):
+    try:
+        entry = uploads.complete_upload(upload_dir, upload_id, source_dir, catalog_path)
+        return jsonify(entry), 200 if entry["duplicate"] else 201
+    except uploads.UploadNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except uploads.IncompleteUploadError as e:
+        return jsonify({"error": str(e)}), 409
+    except uploads.UnsupportedFileTypeError as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id):
+    try:
+        uploads.get_upload(upload_dir, upload_id)
+        uploads.abort_upload(upload_dir, upload_id)
+        return jsonify({"message": "Upload aborted"}), 200
+    except uploads.UploadNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/delete-source-files", methods=["DELETE"])
 def delete_files():
     try:
@@ -119,23 +520,13 @@ def delete_files():
         ):
             return jsonify({"error": "Invalid serial numbers format"}), 400
 
-        input_directory = "source_files"
-        if not os.path.exists(input_directory):
-            return jsonify({"error": "Source files directory does not exist"}), 400
-
-        file_list = sorted(os.listdir(input_directory))
+        # Serial numbers are the stable catalog ids returned by the file list
+        removed = catalog.delete_sources(catalog_path, set(serial_numbers))
         deleted_files_count = 0
-        not_found_files_count = 0
-
-        for serial_number in serial_numbers:
-            # Adjust serial_number to be 1-based index
-            adjusted_index = serial_number - 1
-            if adjusted_index < 0 or adjusted_index >= len(file_list):
-                not_found_files_count += 1
-                continue
+        not_found_files_count = len(set(serial_numbers)) - len(removed)
 
-            file_name = file_list[adjusted_index]
-            file_path = os.path.join(input_directory, file_name)
+        for entry in removed:
+            file_path = os.path.join(source_dir, entry["file_name"])
             if os.path.exists(file_path):
                 os.remove(file_path)
                 deleted_files_count += 1
@@ -172,6 +563,46 @@ def download_results_html():
             return jsonify({"error": "Index must be an integer"}), 400
 
         file_path = os.path.join(output_dir, timestamp, f"{index}.html")
+        gzip_path = os.path.abspath(file_path + ".gz")
+
+        if os.path.exists(gzip_path):
+            # Reports are stored compressed, served as is to clients accepting gzip
+            if "gzip" in request.accept_encodings:
+                response = send_file(
+                    gzip_path,
+                    mimetype="text/html",
+                    as_attachment=True,
+                    download_name=f"{index}.html",
+                    conditional=False,
+                )
+                response.headers["Content-Encoding"] = "gzip"
+                response.vary.add("Accept-Encoding")
+                return response
+            return send_file(
+                gzip.open(gzip_path, "rb"),
+                mimetype="text/html",
+                as_attachment=True,
+                download_name=f"{index}.html",
+            )
+        elif os.path.exists(file_path):
+            return send_file(file_path, as_attachment=True)
+        else:
+            return jsonify({"error": "File not found"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/download-profile", methods=["GET"])
+def download_profile():
+    try:
+        timestamp = request.args.get("timestamp")
+        name = request.args.get("name")
+
+        if not timestamp or not name:
+            return jsonify({"error": "Missing timestamp or name parameter"}), 400
+        if name not in profiling.PROFILE_FILES:
+            return jsonify({"error": "Unknown profile file"}), 400
+
+        file_path = os.path.abspath(os.path.join(output_dir, timestamp, name))
 
         if os.path.exists(file_path):
             return send_file(file_path, as_attachment=True)
@@ -198,7 +629,16 @@ def download_all_timestamp():
 			for root, _, files in os.walk(folder_path):
 				for file in files:
 					file_path = os.path.join(root, file)
-					zip_file.write(file_path, os.path.relpath(file_path, folder_path))
+					arcname = os.path.relpath(file_path, folder_path)
+					if not file.endswith(".html.gz"):
+						zip_file.write(file_path, arcname)
+						continue
+
+					# Compressed reports go in the archive as plain html files
+					with gzip.open(file_path, "rb") as report, zip_file.open(
+						arcname[: -len(".gz")], "w"
+					) as entry:
+						shutil.copyfileobj(report, entry)
 
 		zip_buffer.seek(0)
 		return send_file(zip_buffer, as_attachment=True, download_name=f"{timestamp}.zip")
@@ -206,4 +646,7 @@ def download_all_timestamp():
 		return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
+    # The debug reloader serves the app from a child process, start tasks there only
+    if is_running_from_reloader():
+        start_background_tasks()
     app.run(debug=True)
@@ -0,0 +1,225 @@
+""" This script stores the catalog of source files in a local SQLite database
+
+It gives every source file a stable id which is never reused after deletion.
+It keeps size, type, content hash, ingestion status and token count of each file.
+It lists source files page by page without scanning the source directory.
+It reconciles the catalog with files copied into the source directory by hand.
+
+"""
+
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from os import listdir, path
+from typing import Iterable, Iterator, List, Optional
+
+SUPPORTED_EXTENSIONS = ("txt", "pdf", "docx", "odt")
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL UNIQUE,
+    file_extension TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    sha256 TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    token_count INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_source_files_sha256 ON source_files (sha256);
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def open_catalog(db_path: str) -> Iterator[sqlite3.Connection]:
+    """Yield connection to catalog at db_path inside a transaction, then close it"""
+
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+
+    try:
+        if db_path not in _initialized_paths:
+            # WAL lets readers list files while another worker writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            _initialized_paths.add(db_path)
+
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return hex SHA-256 digest of file, reading it chunk by chunk"""
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_extension(file_name: str) -> str:
+    """Return lowercase extension of file name without the dot"""
+
+    return path.splitext(file_name)[1][1:].lower()
+
+
+def add_source(db_path: str, file_name: str, file_size: int, sha256: str) -> int:
+    """Insert or replace catalog entry for file_name and return its id
+
+    A file stored again under an existing name keeps its id, its content fields are
+    updated and it goes back to pending ingestion.
+
+    """
+
+    with open_catalog(db_path) as connection:
+        connection.execute(
+            """
+            INSERT INTO source_files
+                (file_name, file_extension, file_size, sha256, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (file_name) DO UPDATE SET
+                file_size = excluded.file_size,
+                sha256 = excluded.sha256,
+                status = excluded.status,
+                token_count = NULL
+            """,
+            (
+                file_name,
+                get_extension(file_name),
+                file_size,
+                sha256,
+                STATUS_PENDING,
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+        row = connection.execute(
+            "SELECT id FROM source_files WHERE file_name = ?", (file_name,)
+        ).fetchone()
+
+    return row["id"]
+
+
+def list_sources(
+    db_path: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    exclude_status: Optional[str] = None,
+) -> List[dict]:
+    """Return catalog entries sorted by file name, limit entries from offset"""
+
+    query = "SELECT * FROM source_files"
+    params: list = []
+    if exclude_status:
+        query += " WHERE status != ?"
+        params.append(exclude_status)
+    query += " ORDER BY file_name LIMIT ? OFFSET ?"
+    params.extend([limit if limit is not None else -1, offset])
+
+    with open_catalog(db_path) as connection:
+        rows = connection.execute(query, params).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+def count_sources(db_path: str) -> int:
+    """Return number of entries in the catalog"""
+
+    with open_catalog(db_path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM source_files").fetchone()[0]
+
+
+def find_by_hash(db_path: str, sha256: str) -> Optional[dict]:
+    """Return catalog entry with the given content hash, None if there is none"""
+
+    with open_catalog(db_path) as connection:
+        row = connection.execute(
+            "SELECT * FROM source_files WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+
+    return dict(row) if row else None
+
+
+def delete_sources(db_path: str, ids: Iterable[int]) -> List[dict]:
+    """Remove entries with given ids from catalog and return the removed entries"""
+
+    ids = list(ids)
+    removed: List[dict] = []
+
+    with open_catalog(db_path) as connection:
+        # Batches keep each statement under SQLite's bound parameters limit
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            removed.extend(
+                dict(row)
+                for row in connection.execute(
+                    f"SELECT * FROM source_files WHERE id IN ({placeholders})", batch
+                )
+            )
+            connection.execute(
+                f"DELETE FROM source_files WHERE id IN ({placeholders})", batch
+            )
+
+    return removed
+
+
+def update_ingestion(
+    db_path: str, source_id: int, status: str, token_count: Optional[int] = None
+) -> None:
+    """Record ingestion status and token count of catalog entry"""
+
+    with open_catalog(db_path) as connection:
+        connection.execute(
+            "UPDATE source_files SET status = ?, token_count = ? WHERE id = ?",
+            (status, token_count, source_id),
+        )
+
+
+def sync_directory(db_path: str, source_dir: str) -> None:
+    """Bring catalog in line with the files present in source_dir
+
+    Files missing from the catalog are added, entries whose file disappeared are
+    removed and entries whose size changed are hashed again. Only new or changed
+    files are read, so syncing an unchanged corpus is cheap.
+
+    """
+
+    on_disk = {
+        f: path.getsize(path.join(source_dir, f))
+        for f in listdir(source_dir)
+        if path.isfile(path.join(source_dir, f))
+        and get_extension(f) in SUPPORTED_EXTENSIONS
+    }
+
+    with open_catalog(db_path) as connection:
+        known = {
+            row["file_name"]: (row["id"], row["file_size"])
+            for row in connection.execute(
+                "SELECT id, file_name, file_size FROM source_files"
+            )
+        }
+
+    removed_ids = [entry[0] for name, entry in known.items() if name not in on_disk]
+    delete_sources(db_path, removed_ids)
+
+    # Sorted so a fresh catalog numbers files in the old alphabetical order
+    for file_name, file_size in sorted(on_disk.items()):
+        if file_name in known and known[file_name][1] == file_size:
+            continue
+        add_source(
+            db_path,
+            file_name,
+            file_size,
+            file_sha256(path.join(source_dir, file_name)),
+        )
@@ -0,0 +1,51 @@
+""" This script stores helpers to bound concurrent work per endpoint
+
+It limits how many requests of a group of endpoints run at the same time in a worker.
+It rejects requests with a 503 response when the limit is reached.
+
+"""
+
+from functools import wraps
+from threading import BoundedSemaphore
+from typing import Callable
+
+from flask import jsonify, make_response
+
+
+def limit_concurrency(max_concurrent: int) -> Callable:
+    """Return decorator allowing at most max_concurrent calls of its views at once
+
+    The limit is shared by every view wrapped by the same decorator. Requests
+    arriving while it is reached get a 503 response with a Retry-After header right
+    away, as waiting would hold a server thread needed by other endpoints. The limit
+    applies per worker process, so the server wide limit is max_concurrent * workers.
+    Streamed responses keep their slot until the stream is closed.
+
+    """
+
+    semaphore = BoundedSemaphore(max_concurrent)
+
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not semaphore.acquire(blocking=False):
+                response = jsonify({"error": "Server busy, please retry later"})
+                response.headers["Retry-After"] = "1"
+                return response, 503
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                semaphore.release()
+                raise
+
+            if response.is_streamed:
+                response.call_on_close(semaphore.release)
+            else:
+                semaphore.release()
+
+            return response
+
+        return wrapper
+
+    return decorator
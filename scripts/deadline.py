@@ -0,0 +1,41 @@
+""" This script stores the time budget given to a comparison request
+
+It tells how much time is left before a request deadline.
+It raises an error at check points once the budget is spent.
+
+"""
+
+from time import monotonic
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a comparison runs out of its time budget."""
+
+    pass
+
+
+class Deadline:
+    """Time budget of a request, checked by long running work between steps"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        """Return seconds left, None when there is no time limit"""
+
+        if self.expires_at is None:
+            return None
+
+        return max(0.0, self.expires_at - monotonic())
+
+    def expired(self) -> bool:
+        """Return True once the budget is spent"""
+
+        return self.remaining() == 0.0
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded once the budget is spent"""
+
+        if self.expired():
+            raise DeadlineExceeded("Comparison deadline exceeded")
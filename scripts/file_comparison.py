@@ -5,12 +5,13 @@ This modules compares all txt, docs, odt, pdf files present in path specified as
 It writes results in a HTML table.
 It uses difflib library to find matching sequences.
 It can also use Jaccard Similarity, words counting, overlapping words for similarity
+It can also compare documents window by window to locate similar segments
 
 """
 import webbrowser
 from datetime import datetime
-from os import listdir, path
-from typing import List
+from os import path
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from tqdm import tqdm
 
@@ -19,9 +20,11 @@ from scripts.html_writing import (
     results_to_html,
     papers_comparison,
 )
+from scripts import catalog
+from scripts.deadline import Deadline, DeadlineExceeded
 from scripts.html_utils import writing_results
-from scripts.processing_files import file_extension_call
-from scripts.similarity import difflib_overlap
+from scripts.processing_files import file_extension_call, file_token_hashes
+from scripts.segments import compare_segments, overlap_within_deadline, rank_candidates
 from scripts.utils import wait_for_file, parse_options
 from flask import Response, jsonify
 
@@ -44,83 +47,411 @@ class PathNotFoundError(Exception):
     pass
 
 
-def compare(
-    target_file_path: str, source_dir: str, out_dir: str, block_size: int
-) -> Response:
+def read_target(
+    target_file_path: str, extract: Callable[[str], Sequence] = file_extension_call
+) -> Sequence:
+    """Return words of target file, raising UnsupportedFileError if it can't be read"""
 
     if not path.isfile(target_file_path) or not target_file_path.endswith(
         ("txt", "pdf", "docx", "odt")
     ):
-        return (
-            jsonify({"error": "Invalid target file path or unsupported file type."}),
-            400,
-        )
+        raise UnsupportedFileError("Invalid target file path or unsupported file type.")
+
+    try:
+        return extract(target_file_path)
+    except Exception:  # Corrupted file, e.g. a pdf without its root object
+        raise UnsupportedFileError("Target file could not be read.")
+
+
+def prepare_comparison(
+    target_file_path: str,
+    catalog_path: str,
+    extract: Callable[[str], Sequence] = file_extension_call,
+) -> Tuple[Sequence, List[dict]]:
+    """Return words of target file and catalog entries of source files to compare
+
+    Files are read with extract, returning their words or their token hashes.
+
+    """
+
+    target_file_text = read_target(target_file_path, extract)
+
+    # Files which could not be read before are left out until uploaded again
+    source_entries = catalog.list_sources(
+        catalog_path, exclude_status=catalog.STATUS_FAILED
+    )
+
+    if len(source_entries) < 1:
+        raise MinimumFilesError("At least one srouce file is required for comparison.")
+
+    return target_file_text, source_entries
+
+
+def iter_source_texts(
+    source_entries: List[dict],
+    source_dir: str,
+    catalog_path: str,
+    deadline: Optional[Deadline] = None,
+    unreadable: Optional[set] = None,
+    extract: Callable[[str], Sequence] = file_extension_call,
+) -> Iterator[Tuple[dict, Sequence]]:
+    """Yield catalog entry and words of each readable source file, one at a time
+
+    Ids of missing or unreadable files are added to unreadable. Iteration stops
+    early once deadline has expired.
+
+    """
+
+    unreadable = unreadable if unreadable is not None else set()
+
+    for entry in source_entries:
+        if deadline is not None and deadline.expired():
+            return
+
+        file_path = path.join(source_dir, entry["file_name"])
+        if not path.isfile(file_path):  # Deleted while comparison was starting
+            unreadable.add(entry["id"])
+            continue
+
+        try:
+            file_words = extract(file_path)
+        except Exception:  # Corrupted file, any extractor error marks it failed
+            file_words = []
+        if not file_words:
+            catalog.update_ingestion(catalog_path, entry["id"], catalog.STATUS_FAILED)
+            unreadable.add(entry["id"])
+            continue
+
+        if entry["status"] != catalog.STATUS_READY:
+            catalog.update_ingestion(
+                catalog_path, entry["id"], catalog.STATUS_READY, len(file_words)
+            )
+        yield entry, file_words
 
-    source_files = [
-        f
-        for f in listdir(source_dir)
-        if path.isfile(path.join(source_dir, f))
-        and f.endswith(("txt", "pdf", "docx", "odt"))
+
+def skipped_results(source_entries: List[dict], settled_ids: set) -> List[dict]:
+    """Return skipped status results for entries whose id is not in settled_ids"""
+
+    return [
+        {
+            "source_id": entry["id"],
+            "source_filename": entry["file_name"],
+            "status": "skipped",
+        }
+        for entry in source_entries
+        if entry["id"] not in settled_ids
     ]
 
-    if len(source_files) < 1:
-        return (
-            jsonify({"error": "At least one srouce file is required for comparison."}),
-            400,
-        )
 
-    source_filenames, source_files_text = [], []
+def load_texts(
+    target_file_path: str,
+    source_dir: str,
+    catalog_path: str,
+    deadline: Optional[Deadline] = None,
+    extract: Callable[[str], Sequence] = file_extension_call,
+) -> Tuple[Sequence, List[int], List[str], List[Sequence], List[dict]]:
+    """Return words of target file along with ids, names and words of source files
+
+    The last item lists the source files left unread because deadline expired.
+    Words are read with extract, which may return token hashes instead.
+
+    """
+
+    target_file_text, source_entries = prepare_comparison(
+        target_file_path, catalog_path, extract
+    )
+
+    unreadable: set = set()
+    source_ids, source_filenames, source_files_text = [], [], []
+    for entry, file_words in iter_source_texts(
+        source_entries, source_dir, catalog_path, deadline, unreadable, extract
+    ):
+        source_files_text.append(file_words)
+        source_filenames.append(entry["file_name"])
+        source_ids.append(entry["id"])
+
+    skipped = skipped_results(source_entries, unreadable.union(source_ids))
+    if len(source_files_text) < 1 and not skipped:
+        raise MinimumFilesError("None of the source files could be read.")
+
+    return target_file_text, source_ids, source_filenames, source_files_text, skipped
+
+
+def iter_compare(
+    target_file_path: str,
+    target_file_text: list,
+    source_entries: List[dict],
+    source_dir: str,
+    out_dir: str,
+    block_size: int,
+    catalog_path: str,
+    best_first: bool = False,
+    top_k: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    workers: int = 1,
+) -> Iterator[dict]:
+    """Compare target with each source file, yielding each result once it is ready
+
+    Sources are read and compared one by one in catalog order. With best_first, all
+    sources are read first, then compared from the one containing the largest share
+    of the target shingles, and only the top_k most promising ones are kept. Once
+    deadline expires, the sources not compared yet are yielded as skipped. A source
+    scored before deadline expired but whose HTML report could not be written in
+    time keeps its score, with status report_skipped and no report index. Long
+    documents are compared, along with the matching blocks of their report, in a
+    process of their own (unless workers is 1) stopped when deadline expires.
+
+    """
+
+    deadline = deadline or Deadline()
     target_file_name = path.basename(target_file_path)
-    target_file_text = file_extension_call(target_file_path)
-
-    for file in source_files:
-        file_words = file_extension_call(str(path.join(source_dir, file)))
-        if file_words:  # If all files have supported format
-            source_files_text.append(file_words)
-            source_filenames.append(file)
-        else:
-            raise UnsupportedFileError(
-                "Remove files which are not txt, pdf, docx, or odt and run the script again."
-            )
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    results_directory = writing_results(timestamp)
+    # Microseconds keep the results of concurrent requests apart
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    results_directory = writing_results(timestamp, out_dir)
+
+    settled_ids: set = set()  # Compared, unreadable or pruned source ids
+    sources: Iterable[Tuple[dict, list]] = iter_source_texts(
+        source_entries, source_dir, catalog_path, deadline, settled_ids
+    )
+    if best_first:
+        sources = list(sources)
+        ranking = rank_candidates(target_file_text, [words for _, words in sources])
+        settled_ids.update(entry["id"] for entry, _ in sources)
+        sources = [sources[doc_ind] for doc_ind, _ in ranking[:top_k]]
+        settled_ids.difference_update(entry["id"] for entry, _ in sources)
 
-    difflib_scores: List[float] = [0.0 for _ in range(len(source_files_text))]
     file_ind = 0
+    for entry, source_text in sources:
+        try:
+            deadline.check()
+            difflib_score, matching_blocks = overlap_within_deadline(
+                target_file_text, source_text, workers, deadline, block_size
+            )
+        except DeadlineExceeded:
+            break
+
+        settled_ids.add(entry["id"])
+        try:
+            deadline.check()
+            saved_path = papers_comparison(
+                results_directory,
+                file_ind,
+                source_text,
+                target_file_text,
+                (entry["file_name"], target_file_name),
+                block_size,
+                deadline,
+                matching_blocks,
+            )
+        except DeadlineExceeded:
+            yield {
+                "source_id": entry["id"],
+                "source_filename": entry["file_name"],
+                "difflib_score": difflib_score,
+                "status": "report_skipped",
+            }
+            break
 
-    for i, source_text in enumerate(source_files_text):
-        difflib_scores[i] = difflib_overlap(target_file_text, source_text)
-        saved_path = papers_comparison(
-            results_directory,
-            file_ind,
-            source_text,
-            target_file_text,
-            (source_filenames[i], target_file_name),
-            block_size,
-        )
         print(
             "Compared ",
             target_file_name,
             "with ",
-            source_filenames[i],
+            entry["file_name"],
             "\twith difflib score:",
-            difflib_scores[i],
+            difflib_score,
             "\t and saved to",
             saved_path,
         )
+
+        yield {
+            "source_id": entry["id"],
+            "source_filename": entry["file_name"],
+            "difflib_score": difflib_score,
+            "timestamp": timestamp,
+            "index": file_ind,
+            "status": "completed",
+        }
         file_ind += 1
 
-    results_json = {
-        "target_file": target_file_name,
-        "source_files": [
+    yield from skipped_results(source_entries, settled_ids)
+
+
+def score_sources(
+    target_file_text: list,
+    source_dir: str,
+    catalog_path: str,
+    top_k: Optional[int] = None,
+    candidates: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    workers: int = 1,
+) -> Tuple[int, List[dict], int]:
+    """Score target against local source files without writing HTML reports
+
+    Return the number of compared source files, the top_k best results and the
+    number of sources skipped because deadline expired. With candidates, only that
+    many sources ranked best by shared shingles are compared. Used by shards, whose
+    results are merged by a coordinator.
+
+    """
+
+    deadline = deadline or Deadline()
+    source_entries = catalog.list_sources(
+        catalog_path, exclude_status=catalog.STATUS_FAILED
+    )
+    settled_ids: set = set()
+    sources: Iterable[Tuple[dict, list]] = iter_source_texts(
+        source_entries, source_dir, catalog_path, deadline, settled_ids
+    )
+    if candidates is not None:
+        sources = list(sources)
+        ranking = rank_candidates(target_file_text, [words for _, words in sources])
+        settled_ids.update(entry["id"] for entry, _ in sources)
+        sources = [sources[doc_ind] for doc_ind, _ in ranking[:candidates]]
+        settled_ids.difference_update(entry["id"] for entry, _ in sources)
+
+    results = []
+    for entry, source_text in sources:
+        try:
+            difflib_score, _ = overlap_within_deadline(
+                target_file_text, source_text, workers, deadline
+            )
+        except DeadlineExceeded:
+            break
+        settled_ids.add(entry["id"])
+        results.append(
             {
-                "source_filename": source_filenames[i],
-                "difflib_score": difflib_scores[i],
-                "timestamp": timestamp,
-                "index": i,
+                "source_id": entry["id"],
+                "source_filename": entry["file_name"],
+                "difflib_score": difflib_score,
             }
-            for i in range(len(source_filenames))
-        ],
+        )
+    results.sort(key=lambda result: result["difflib_score"], reverse=True)
+    skipped = len(skipped_results(source_entries, settled_ids))
+
+    return len(results), results[:top_k], skipped
+
+
+def compare(
+    target_file_path: str,
+    source_dir: str,
+    out_dir: str,
+    block_size: int,
+    catalog_path: str,
+    best_first: bool = False,
+    top_k: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    workers: int = 1,
+) -> Response:
+
+    try:
+        target_file_text, source_entries = prepare_comparison(
+            target_file_path, catalog_path
+        )
+    except (UnsupportedFileError, MinimumFilesError) as error:
+        return jsonify({"error": str(error)}), 400
+
+    source_results = list(
+        iter_compare(
+            target_file_path,
+            target_file_text,
+            source_entries,
+            source_dir,
+            out_dir,
+            block_size,
+            catalog_path,
+            best_first,
+            top_k,
+            deadline,
+            workers,
+        )
+    )
+    if len(source_results) < 1:
+        return jsonify({"error": "None of the source files could be read."}), 400
+
+    results_json = {
+        "target_file": path.basename(target_file_path),
+        "source_files": source_results,
+        "partial": any(result["status"] != "completed" for result in source_results),
     }
 
     return jsonify(results_json)
+
+
+def compare_windowed(
+    target_file_path: str,
+    source_dir: str,
+    catalog_path: str,
+    window_size: int,
+    step: int,
+    threshold: float,
+    workers: int = 1,
+    top_segments: int = 10,
+    deadline: Optional[Deadline] = None,
+) -> Response:
+    """Compare target with source files window by window and locate similar segments
+
+    Instead of one difflib ratio over whole documents, each source gets the share of
+    target words lying in a window similar to one of its windows, with the offsets
+    (in words) of its best matching window pairs. No HTML report is written. Once
+    deadline expires, unread sources are skipped and unscored windows ignored.
+
+    """
+
+    try:
+        (
+            target_file_text,
+            source_ids,
+            source_filenames,
+            source_files_text,
+            skipped,
+        ) = load_texts(
+            target_file_path,
+            source_dir,
+            catalog_path,
+            deadline,
+            # Windows compare token hashes, cheaper to index and send to workers
+            extract=file_token_hashes,
+        )
+    except (UnsupportedFileError, MinimumFilesError) as error:
+        return jsonify({"error": str(error)}), 400
+
+    segment_results, partial = compare_segments(
+        target_file_text,
+        source_files_text,
+        window_size=window_size,
+        step=step,
+        threshold=threshold,
+        workers=workers,
+        deadline=deadline,
+    )
+
+    source_results = []
+    hotspots = []
+    for i, result in enumerate(segment_results):
+        source_results.append(
+            {
+                "source_id": source_ids[i],
+                "source_filename": source_filenames[i],
+                "segment_score": result["segment_score"],
+                "segments": result["segments"][:top_segments],
+                # Some of its windows may not have been scored in time
+                "status": "partial" if partial else "completed",
+            }
+        )
+        hotspots.extend(
+            {"source_id": source_ids[i], **segment}
+            for segment in result["segments"][:top_segments]
+        )
+
+    hotspots.sort(key=lambda segment: segment["score"], reverse=True)
+
+    return jsonify(
+        {
+            "target_file": path.basename(target_file_path),
+            "target_word_count": len(target_file_text),
+            "window_size": window_size,
+            "source_files": source_results + skipped,
+            "hotspots": hotspots[:top_segments],
+            "partial": partial or bool(skipped),
+        }
+    )
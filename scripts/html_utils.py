@@ -8,9 +8,11 @@ It returns colors depending on the similarity score.
 
 import difflib
 from operator import itemgetter
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from os import getcwd, path, makedirs
 
+from scripts.deadline import Deadline
+
 
 def get_real_matching_blocks(
     words_list1: list, words_list2: list, minimum_size: int = 2
@@ -27,13 +29,19 @@ def get_real_matching_blocks(
 
 
 def get_ordered_blocks_positions(
-    string: str, matching_blocks: list, string_blocks: list
+    string: str,
+    matching_blocks: list,
+    string_blocks: list,
+    deadline: Optional[Deadline] = None,
 ) -> list:
     """Return ordered list of all positions of matching blocks in string"""
 
     all_blocks_positions: List[Tuple[int, int]] = []
 
     for block_ind, _ in enumerate(matching_blocks):
+        if deadline is not None:  # Each block scans the whole string
+            deadline.check()
+
         # Find all positions of substring in string
         block_positions = [
             char
@@ -76,10 +84,10 @@ def blocks_list_to_strings_list(blocks_list: list, curr_text: list) -> list:
     return strings_len_list
 
 
-def writing_results(dir_name: str) -> str:
-    """Create new directory for results in current working directory"""
+def writing_results(dir_name: str, out_dir: str = "results") -> str:
+    """Create new directory for results in the output directory"""
 
-    final_directory = path.join("results", dir_name)
+    final_directory = path.join(out_dir, dir_name)
     if not path.exists(final_directory):
         makedirs(final_directory)
 
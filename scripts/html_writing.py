@@ -3,14 +3,14 @@
 It adds links to HTML table.
 It generates span tags for un/colored matching blocks.
 It compares two text files
-It inserts comparison results in corresponding html files
+It inserts comparison results in corresponding gzip compressed html files
 
 """
 
+import gzip
 from os import fsync, path
 from random import randint
-from shutil import copyfile, copy
-from typing import Any, List
+from typing import Any, List, Optional
 
 from bs4 import BeautifulSoup as Bs
 import importlib.resources
@@ -22,6 +22,7 @@ from scripts.html_utils import (
     blocks_list_to_strings_list,
     get_ordered_blocks_positions,
 )
+from scripts.deadline import Deadline
 from scripts.utils import is_float
 
 
@@ -60,13 +61,21 @@ def add_links_to_html_table(html_path: str) -> None:
             f_output.close()
 
 
-def get_span_blocks(bs_obj: Bs, text1: list, text2: list, block_size: int) -> list:
+def get_span_blocks(
+    bs_obj: Bs,
+    text1: list,
+    text2: list,
+    block_size: int,
+    deadline: Optional[Deadline] = None,
+    matching_blocks: Optional[list] = None,
+) -> list:
     """Return list of spans with colors for HTML rendering"""
 
     results: List[List[Any]] = [[], []]  # List of spans list
 
-    # Get matching blocks with chosen minimum size
-    matching_blocks = get_real_matching_blocks(text1, text2, block_size)
+    # Get matching blocks with chosen minimum size, unless already searched
+    if matching_blocks is None:
+        matching_blocks = get_real_matching_blocks(text1, text2, block_size)
 
     # Generate one unique color for each matching block
     colors = [f"#{randint(0, 0xFFFFFF):06X}" for _ in range(len(matching_blocks))]
@@ -83,8 +92,8 @@ def get_span_blocks(bs_obj: Bs, text1: list, text2: list, block_size: int) -> li
     str1, str2 = " ".join(map(str, text1)), " ".join(map(str, text2))
 
     global_positions_list = [
-        get_ordered_blocks_positions(str1, matching_blocks, string_blocks),
-        get_ordered_blocks_positions(str2, matching_blocks, string_blocks),
+        get_ordered_blocks_positions(str1, matching_blocks, string_blocks, deadline),
+        get_ordered_blocks_positions(str2, matching_blocks, string_blocks, deadline),
     ]
 
     for num, pos_list in enumerate(global_positions_list):
@@ -120,40 +129,47 @@ def get_span_blocks(bs_obj: Bs, text1: list, text2: list, block_size: int) -> li
 
 
 def papers_comparison(
-    save_dir: str, ind: int, text1: list, text2: list, filenames: tuple, block_size: int
+    save_dir: str,
+    ind: int,
+    text1: list,
+    text2: list,
+    filenames: tuple,
+    block_size: int,
+    deadline: Optional[Deadline] = None,
+    matching_blocks: Optional[list] = None,
 ) -> None:
     """Write to HTML file texts that have been compared with highlighted similar blocks"""
 
+    # The template is read rather than copied, so that no shared file is rewritten
     try:
-        with importlib.resources.path("scripts", "template.html") as template_path:
-            comp_path = path.join(save_dir, f"{ind}.html")
-            copyfile(template_path, comp_path)
+        template = (
+            importlib.resources.files("scripts")
+            .joinpath("template.html")
+            .read_text(encoding="utf-8")
+        )
     except ModuleNotFoundError:
         # Fallback for local development
-        template_path_local = path.join("template.html")
-        comp_path = path.join(save_dir, str(ind) + ".html")
-
-        # Copy the template to the save directory under a new name
-        copy(template_path_local, comp_path)
-
-    with open(comp_path, encoding="utf-8") as html:
-        soup = Bs(html, "html.parser")
-        res = get_span_blocks(soup, text1, text2, block_size)
-        blocks = [soup.find(id="leftContent"), soup.find(id="rightContent")]
-
-        # Append filename tags and span tags to html
-        for i, filename in enumerate(filenames):
-            temp_tag = soup.new_tag("h3")
-            temp_tag.string = filename
-            blocks[i].append(temp_tag)
-            for tag in res[i]:
-                blocks[i].append(tag)
-
-    # Write the modified content back to the file
-    with open(comp_path, "wb") as f_output:
-        f_output.write(soup.prettify("utf-8"))
-
-    return comp_path
+        with open(path.join("template.html"), encoding="utf-8") as html:
+            template = html.read()
+
+    comp_path = path.join(save_dir, f"{ind}.html")
+    soup = Bs(template, "html.parser")
+    res = get_span_blocks(soup, text1, text2, block_size, deadline, matching_blocks)
+    blocks = [soup.find(id="leftContent"), soup.find(id="rightContent")]
+
+    # Append filename tags and span tags to html
+    for i, filename in enumerate(filenames):
+        temp_tag = soup.new_tag("h3")
+        temp_tag.string = filename
+        blocks[i].append(temp_tag)
+        for tag in res[i]:
+            blocks[i].append(tag)
+
+    # Write the modified content compressed, next to no whitespace is added
+    with gzip.open(comp_path + ".gz", "wb", compresslevel=6) as f_output:
+        f_output.write(str(soup).encode("utf-8"))
+
+    return comp_path + ".gz"
 
 
 def results_to_html(scores: list, files_names: list, html_path: str) -> None:
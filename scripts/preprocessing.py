@@ -0,0 +1,201 @@
+""" This script turns text extracted from files into normalized words and token hashes
+
+It folds text chunks with Unicode normalization and case folding.
+It splits text chunks in words, keeping words cut at chunk boundaries whole.
+It keeps, masks or drops numbers and can drop stop words.
+It hashes words to stable 64-bit integers stored in a compact array, on request.
+
+"""
+
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+NUMBERS_KEEP = "keep"
+NUMBERS_MASK = "mask"  # Every number becomes NUMBER_TOKEN
+NUMBERS_DROP = "drop"
+NUMBER_MODES = (NUMBERS_KEEP, NUMBERS_MASK, NUMBERS_DROP)
+NUMBER_TOKEN = "0"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Characters checked at once when looking for the start of a trailing word
+WORD_BLOCK = 64
+
+# Characters checked at once for NFKC form, only blocks not in that form are changed
+NORMALIZATION_BLOCK = 4096
+
+
+@lru_cache(maxsize=1 << 16)
+def token_hash(word: str) -> int:
+    """Return 64-bit hash of word, stable across processes and restarts"""
+
+    digest = blake2b(word.encode("utf-8"), digest_size=8).digest()
+
+    return int.from_bytes(digest, "little")
+
+
+def nfkc_normalize(text: str) -> str:
+    """Return text in NFKC form, normalizing only the blocks which are not
+
+    Blocks end before a space, which never combines with the character before it,
+    so they can be normalized apart from each other.
+
+    """
+
+    if unicodedata.is_normalized("NFKC", text):
+        return text
+
+    blocks = []
+    start = 0
+    while start < len(text):
+        end = text.find(" ", start + NORMALIZATION_BLOCK)
+        if end == -1:
+            end = len(text)
+        block = text[start:end]
+        if not unicodedata.is_normalized("NFKC", block):
+            block = unicodedata.normalize("NFKC", block)
+        blocks.append(block)
+        start = end
+
+    return "".join(blocks)
+
+
+def fold_text(text: str, strip_accents: bool = False) -> str:
+    """Return text in NFKC form and case folded, optionally without accents"""
+
+    # ASCII text is already in NFKC form, and lower equals casefold for it
+    if text.isascii():
+        return text.lower()
+    text = nfkc_normalize(text).casefold()
+    if strip_accents:
+        text = "".join(
+            char
+            for char in unicodedata.normalize("NFKD", text)
+            if not unicodedata.combining(char)
+        )
+        text = unicodedata.normalize("NFC", text)
+
+    return text
+
+
+def split_trailing_word(text: str) -> Tuple[str, str]:
+    """Split text before the word it ends with, which may continue in next chunk"""
+
+    # Step back over blocks made only of word characters, then over characters,
+    # matching from every position instead would be quadratic
+    cut = len(text)
+    while cut >= WORD_BLOCK and WORD_PATTERN.fullmatch(text, cut - WORD_BLOCK, cut):
+        cut -= WORD_BLOCK
+    while cut and WORD_PATTERN.fullmatch(text, cut - 1, cut):
+        cut -= 1
+
+    return text[:cut], text[cut:]
+
+
+def english_stop_words() -> frozenset:
+    """Return English stop words of nltk"""
+
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("english"))
+
+
+class Preprocessor:
+    """Normalization settings shared by the extractors of every file format"""
+
+    def __init__(
+        self,
+        numbers: str = NUMBERS_KEEP,
+        strip_accents: bool = False,
+        stop_words: Optional[Iterable[str]] = None,
+    ):
+        if numbers not in NUMBER_MODES:
+            raise ValueError(f"numbers must be one of {', '.join(NUMBER_MODES)}")
+
+        self.numbers = numbers
+        self.strip_accents = strip_accents
+        self.stop_words = (
+            frozenset(fold_text(word, strip_accents) for word in stop_words)
+            if stop_words
+            else frozenset()
+        )
+
+    def filter_words(self, words: List[str]) -> List[str]:
+        """Apply number handling and stop words removal to normalized words"""
+
+        if self.numbers == NUMBERS_DROP:
+            words = [word for word in words if not word.isdigit()]
+        elif self.numbers == NUMBERS_MASK:
+            words = [NUMBER_TOKEN if word.isdigit() else word for word in words]
+        if self.stop_words:
+            words = [word for word in words if word not in self.stop_words]
+
+        return words
+
+    def iter_word_batches(self, chunks: Iterable[str]) -> Iterator[List[str]]:
+        """Yield normalized words of each text chunk
+
+        A word cut by the end of a chunk is carried over and completed by the next
+        one, so chunks can be split anywhere.
+
+        """
+
+        carry = ""
+        for chunk in chunks:
+            text, tail = split_trailing_word(chunk)
+            if not text:  # Chunk only continues the carried word
+                carry += chunk
+                continue
+            text, carry = carry + text, tail
+            words = WORD_PATTERN.findall(fold_text(text, self.strip_accents))
+            if words:
+                yield self.filter_words(words)
+
+        words = WORD_PATTERN.findall(fold_text(carry, self.strip_accents))
+        if words:
+            yield self.filter_words(words)
+
+    def words(self, chunks: Iterable[str]) -> List[str]:
+        """Return normalized words of text chunks"""
+
+        words: List[str] = []
+        for batch in self.iter_word_batches(chunks):
+            words.extend(batch)
+
+        return words
+
+    def hashes(self, chunks: Iterable[str]) -> array:
+        """Return 64-bit hashes of the normalized words of text chunks"""
+
+        hashes = array("Q")
+        for batch in self.iter_word_batches(chunks):
+            hashes.extend(map(token_hash, batch))
+
+        return hashes
+
+
+_preprocessor = Preprocessor()
+
+
+def configure(
+    numbers: str = NUMBERS_KEEP, strip_accents: bool = False, stop_words: bool = False
+) -> Preprocessor:
+    """Set normalization used for every extracted file, return its preprocessor"""
+
+    global _preprocessor
+
+    _preprocessor = Preprocessor(
+        numbers, strip_accents, english_stop_words() if stop_words else None
+    )
+
+    return _preprocessor
+
+
+def get_preprocessor() -> Preprocessor:
+    """Return preprocessor set up by configure"""
+
+    return _preprocessor
@@ -1,12 +1,22 @@
 """ This module is used to process text in docx, odt, txt and pdf files """
 
+import io
 import re
 import zipfile
+from array import array
 from os import path
+from typing import Iterator
 
 from odf import text, teletype
 from odf.opendocument import load
-from pdfminer.high_level import extract_text
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+
+from scripts.preprocessing import get_preprocessor
+
+CHUNK_SIZE = 1 << 20  # Characters read at once from txt and docx files
+
+TAG_PATTERN = re.compile(r"<[^>]*>")
 
 
 def get_file_extension(filepath: str) -> str:
@@ -20,19 +30,19 @@ def get_file_extension(filepath: str) -> str:
         raise ValueError(f"File extension error for file: {filepath}")
 
 
-def file_extension_call(file: str) -> list:
-    """Map file extension to appropriate function"""
+def iter_file_text(file: str) -> Iterator[str]:
+    """Map file extension to the function yielding its text chunks"""
 
     extension = get_file_extension(file)
 
     if extension == ".pdf":
-        return get_words_from_pdf_file(file)
+        return iter_pdf_text(file)
     elif extension == ".docx":
-        return get_words_from_docx_file(file)
+        return iter_docx_text(file)
     elif extension == ".odt":
-        return get_words_from_odt_file(file)
+        return iter_odt_text(file)
     elif extension == ".txt":
-        return get_words_from_txt_file(file)
+        return iter_txt_text(file)
     else:
         raise ValueError(
             f"File format not supported for file: {file}. "
@@ -40,60 +50,67 @@ def file_extension_call(file: str) -> list:
         )
 
 
-def get_words_from_pdf_file(pdf_path: str) -> list:
-    """Return list of words from pdf file at specified path using pdfminer.six."""
+def file_extension_call(file: str) -> list:
+    """Return normalized words of file"""
 
-    # Extract text from the PDF file using pdfminer
-    extracted_text = extract_text(pdf_path)
+    return get_preprocessor().words(iter_file_text(file))
 
-    # Clean up the extracted text
-    cleaned_text = re.sub(r"\s+", " ", extracted_text)
-    cleaned_text = re.sub(r"<(.|\n)*?>", "", cleaned_text)
 
-    # Extract words from the cleaned text
-    words = re.findall(r"\w+", cleaned_text.lower())
+def file_token_hashes(file: str) -> array:
+    """Return 64-bit hashes of the normalized words of file"""
 
-    return words
+    return get_preprocessor().hashes(iter_file_text(file))
 
 
-def get_words_from_txt_file(txt_path: str) -> list:
-    """Return list of words from txt file at specified path"""
+def iter_pdf_text(pdf_path: str) -> Iterator[str]:
+    """Yield text of pdf file at specified path page by page using pdfminer.six."""
 
-    words = []
+    for page_layout in extract_pages(pdf_path):
+        page_text = "".join(
+            element.get_text()
+            for element in page_layout
+            if isinstance(element, LTTextContainer)
+        )
+        yield TAG_PATTERN.sub("", page_text) + "\n"
 
-    with open(txt_path, encoding="utf-8") as file:
-        for line in file:
-            try:
-                for word in line.split():
-                    words.append(word.lower())
-            except (UnicodeError, UnicodeDecodeError):
-                pass
 
-    str_words = " ".join(map(str, words))
+def iter_txt_text(txt_path: str) -> Iterator[str]:
+    """Yield text of txt file at specified path in chunks"""
 
-    return re.findall(r"\w+", str_words)
+    # Undecodable bytes become U+FFFD, which is not part of any word
+    with open(txt_path, encoding="utf-8", errors="replace") as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
 
 
-def get_words_from_docx_file(docx_path: str) -> list:
-    """Return list of words from docx file at specified path"""
+def iter_docx_text(docx_path: str) -> Iterator[str]:
+    """Yield text of docx file at specified path in chunks, without xml tags"""
 
-    with zipfile.ZipFile(docx_path) as docx:
-        content = docx.read("word/document.xml").decode("utf-8")
-        cleaned = re.sub("<(.|\n)*?>", "", content)
+    with zipfile.ZipFile(docx_path) as docx, docx.open("word/document.xml") as xml:
+        content = io.TextIOWrapper(xml, encoding="utf-8")
+        carry = ""
+        while True:
+            chunk = content.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk = carry + chunk
+            # A tag cut by the end of the chunk is stripped with the next one
+            cut = chunk.rfind("<")
+            if cut == -1 or cut < chunk.rfind(">"):
+                cut = len(chunk)
+            chunk, carry = chunk[:cut], chunk[cut:]
+            yield TAG_PATTERN.sub("", chunk)
 
-    return re.findall(r"\w+", cleaned.lower())
+        yield TAG_PATTERN.sub("", carry)
 
 
-def get_words_from_odt_file(odt_path: str) -> list:
-    """Return list of words from odt file at specified path"""
+def iter_odt_text(odt_path: str) -> Iterator[str]:
+    """Yield text of odt file at specified path paragraph by paragraph"""
 
     textdoc = load(odt_path)
-    paragraphs = textdoc.getElementsByType(text.P)
-
-    full_text = str()
-
-    for paragraph in paragraphs:
-        temp = teletype.extractText(paragraph)
-        full_text += temp.lower()
 
-    return re.findall(r"\w+", full_text)
+    for paragraph in textdoc.getElementsByType(text.P):
+        yield teletype.extractText(paragraph) + "\n"
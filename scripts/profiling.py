@@ -0,0 +1,118 @@
+""" This script profiles single requests on demand
+
+It decides whether a request is profiled, on request or for 1 in N requests.
+It runs the request under cProfile and tracemalloc.
+It saves the CPU and memory statistics next to the request results.
+
+"""
+
+import cProfile
+import io
+import itertools
+import pstats
+import tracemalloc
+from datetime import datetime
+from os import path
+from threading import Lock
+from typing import Callable, List
+from urllib.parse import urlencode
+
+from flask import Response, jsonify, make_response
+
+from scripts.html_utils import writing_results
+
+PROFILE_FILES = ("profile.prof", "profile.txt", "memory.txt")
+
+# tracemalloc is process wide, so one request at a time is profiled per worker
+_profiling_lock = Lock()
+_request_counter = itertools.count(1)
+
+
+def should_profile(requested: bool, enabled: bool, sample_rate: int) -> bool:
+    """Return True if request is explicitly profiled or is the 1 in sample_rate"""
+
+    if requested and enabled:
+        return True
+
+    return sample_rate > 0 and next(_request_counter) % sample_rate == 0
+
+
+def save_stats(
+    profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak: int, out: str
+) -> List[str]:
+    """Write CPU and memory statistics files in directory out, return their names"""
+
+    profiler.dump_stats(path.join(out, "profile.prof"))
+
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+    with open(path.join(out, "profile.txt"), "w", encoding="utf-8") as file:
+        file.write(text.getvalue())
+
+    with open(path.join(out, "memory.txt"), "w", encoding="utf-8") as file:
+        file.write(
+            f"Peak traced memory: {peak} bytes\n"
+            "Traced in the whole worker process, other requests included\n\n"
+            "Top allocations by line:\n"
+        )
+        for stat in snapshot.statistics("lineno")[:30]:
+            file.write(f"{stat}\n")
+
+    return list(PROFILE_FILES)
+
+
+def profiled_response(run: Callable, out_dir: str) -> Response:
+    """Call run under cProfile and tracemalloc, and link the stats in its response
+
+    Stats are saved in the results directory of the response (its timestamp or
+    report_id) or in a new one, and the JSON response gets a `profile` entry with
+    their download urls. Requests arriving while another one is being profiled in
+    this worker run without profiling.
+
+    """
+
+    if not _profiling_lock.acquire(blocking=False):
+        return make_response(run())
+
+    try:
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            response = make_response(run())
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        _profiling_lock.release()
+
+    data = response.get_json(silent=True)
+    if not isinstance(data, dict):
+        return response
+
+    # The first results may be skipped ones, without a results directory
+    timestamp = data.get("report_id") or next(
+        (
+            result["timestamp"]
+            for result in data.get("source_files") or []
+            if result.get("timestamp")
+        ),
+        None,
+    )
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    results_directory = writing_results(timestamp, out_dir)
+    file_names = save_stats(profiler, snapshot, peak, results_directory)
+    data["profile"] = {
+        "timestamp": timestamp,
+        "files": [
+            "/download-profile?" + urlencode({"timestamp": timestamp, "name": name})
+            for name in file_names
+        ],
+    }
+
+    return make_response(jsonify(data), response.status_code)
@@ -0,0 +1,100 @@
+""" This script removes old comparison results to bound their disk usage
+
+It deletes result directories older than a maximum age.
+It deletes the oldest result directories while results exceed a maximum total size.
+It runs these sweeps periodically in a background thread.
+
+"""
+
+from os import path, scandir, walk
+from shutil import rmtree
+from threading import Event, Thread
+from time import time
+from typing import List, Tuple
+
+# Directories modified this recently may still be written by a comparison
+IN_PROGRESS_GRACE = 15 * 60
+
+
+def get_directory_size(dir_path: str) -> int:
+    """Return total size in bytes of files under dir_path"""
+
+    total = 0
+    for root, _, files in walk(dir_path):
+        for file_name in files:
+            try:
+                total += path.getsize(path.join(root, file_name))
+            except FileNotFoundError:
+                pass
+
+    return total
+
+
+def list_result_directories(out_dir: str) -> List[Tuple[str, float, int]]:
+    """Return path, modification time and size of each result directory, oldest first"""
+
+    if not path.exists(out_dir):
+        return []
+
+    directories = [
+        (entry.path, entry.stat().st_mtime, get_directory_size(entry.path))
+        for entry in scandir(out_dir)
+        if entry.is_dir()
+    ]
+
+    return sorted(directories, key=lambda directory: directory[1])
+
+
+def sweep_results(out_dir: str, max_age: float = 0, max_total_size: int = 0) -> int:
+    """Remove result directories beyond max_age seconds or max_total_size bytes
+
+    A limit set to 0 is disabled. Directories modified in the last minutes are kept
+    whatever the limits, as a comparison may still be writing in them. Return the
+    number of removed directories.
+
+    """
+
+    now = time()
+    directories = list_result_directories(out_dir)
+    total_size = sum(size for _, _, size in directories)
+    removed = 0
+
+    for dir_path, modified, size in directories:
+        if now - modified < IN_PROGRESS_GRACE:
+            break
+
+        too_old = max_age and now - modified > max_age
+        too_big = max_total_size and total_size > max_total_size
+        if not (too_old or too_big):
+            continue
+
+        rmtree(dir_path, ignore_errors=True)
+        total_size -= size
+        removed += 1
+
+    return removed
+
+
+def start_sweeper(
+    out_dir: str, interval: float, max_age: float = 0, max_total_size: int = 0
+) -> Event:
+    """Sweep results every interval seconds in a daemon thread
+
+    Return an event stopping the thread once set.
+
+    """
+
+    stop = Event()
+
+    def run() -> None:
+        while not stop.wait(interval):
+            try:
+                removed = sweep_results(out_dir, max_age, max_total_size)
+                if removed:
+                    print("Removed", removed, "old results directories from", out_dir)
+            except OSError as error:
+                print("Results sweep failed:", error)
+
+    Thread(target=run, name="results-sweeper", daemon=True).start()
+
+    return stop
@@ -0,0 +1,323 @@
+""" This script scores similarity between fixed-size windows of documents
+
+It splits word lists in overlapping token windows.
+It indexes source windows by their word shingles to find candidate window pairs.
+It ranks source documents by shared shingles to compare promising ones first.
+It scores candidate pairs with difflib in parallel batches.
+It derives a document score from the target words covered by matching windows.
+It compares long documents in a process stopped when a request deadline passes.
+
+"""
+
+import difflib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from scripts.deadline import Deadline, DeadlineExceeded
+from scripts.html_utils import get_real_matching_blocks
+from scripts.similarity import difflib_overlap
+
+Window = Tuple[int, int]  # Start and end (excluded) word offsets in a document
+
+# Whole document pairs whose word counts multiply to less are compared in the
+# request thread, where starting a process for them would cost more
+POOL_MIN_WORK = 10000 * 10000
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = Lock()
+
+
+def split_windows(words: Sequence, window_size: int, step: int) -> List[Window]:
+    """Return offsets of windows of window_size words every step words"""
+
+    if len(words) <= window_size:
+        return [(0, len(words))] if words else []
+
+    windows = [(start, start + window_size) for start in range(0, len(words), step)]
+    windows = [w for w in windows if w[1] <= len(words)]
+    if windows[-1][1] < len(words):  # Last window ends with the document
+        windows.append((len(words) - window_size, len(words)))
+
+    return windows
+
+
+def get_shingles(words: Sequence, size: int = 3) -> set:
+    """Return set of consecutive word tuples of given size"""
+
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def build_window_index(
+    documents: List[Sequence], window_size: int, step: int, shingle_size: int = 3
+) -> Tuple[Dict[tuple, List[Tuple[int, int]]], List[List[Window]]]:
+    """Index windows of documents by shingle
+
+    Return the index mapping each shingle to (document, window) positions, along with
+    the windows of every document.
+
+    """
+
+    index: Dict[tuple, List[Tuple[int, int]]] = defaultdict(list)
+    all_windows = []
+
+    for doc_ind, words in enumerate(documents):
+        windows = split_windows(words, window_size, step)
+        all_windows.append(windows)
+        for win_ind, (start, end) in enumerate(windows):
+            for shingle in get_shingles(words[start:end], shingle_size):
+                index[shingle].append((doc_ind, win_ind))
+
+    return index, all_windows
+
+
+def rank_candidates(
+    target_words: Sequence, source_documents: List[Sequence], shingle_size: int = 3
+) -> List[Tuple[int, float]]:
+    """Return (document index, percentage of target shingles found in document)
+
+    This is a cheap estimate of how much of the target each document may contain,
+    sorted from the most promising document, used to prune and order comparisons.
+
+    """
+
+    target_shingles = get_shingles(target_words, shingle_size)
+    if not target_shingles:
+        return [(doc_ind, 0.0) for doc_ind in range(len(source_documents))]
+
+    ranking = [
+        (
+            doc_ind,
+            round(
+                len(target_shingles & get_shingles(words, shingle_size))
+                / len(target_shingles)
+                * 100,
+                3,
+            ),
+        )
+        for doc_ind, words in enumerate(source_documents)
+    ]
+
+    return sorted(ranking, key=lambda rank: rank[1], reverse=True)
+
+
+def _score_batch(batch: List[Tuple[Sequence, Sequence]]) -> List[float]:
+    """Return difflib similarity percentage of each pair of word lists"""
+
+    return [
+        round(difflib.SequenceMatcher(a=a, b=b, autojunk=False).ratio() * 100, 3)
+        for a, b in batch
+    ]
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Return process pool shared by requests of this worker, created on first use"""
+
+    global _executor, _executor_workers
+
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # Spawned processes, forking a threaded server process is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=get_context("spawn")
+            )
+            _executor_workers = workers
+
+    return _executor
+
+
+def score_pairs(
+    pairs: List[Tuple[Sequence, Sequence]],
+    workers: int = 1,
+    batch_size: int = 256,
+    deadline: Optional[Deadline] = None,
+) -> List[Optional[float]]:
+    """Score word list pairs, in parallel batches when several workers are allowed
+
+    Pairs of batches not scored before deadline expires get None.
+
+    """
+
+    deadline = deadline or Deadline()
+    batches = [pairs[i : i + batch_size] for i in range(0, len(pairs), batch_size)]
+    scores: List[Optional[float]] = []
+
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            if deadline.expired():
+                scores.extend(None for _ in batch)
+            else:
+                scores.extend(_score_batch(batch))
+        return scores
+
+    executor = _get_executor(workers)
+    futures = [executor.submit(_score_batch, batch) for batch in batches]
+    for future, batch in zip(futures, batches):
+        try:
+            scores.extend(future.result(timeout=deadline.remaining()))
+        except FuturesTimeoutError:
+            future.cancel()
+            scores.extend(None for _ in batch)
+
+    return scores
+
+
+def _compare_documents(
+    connection: Connection,
+    target_words: Sequence,
+    source_words: Sequence,
+    block_size: Optional[int],
+) -> None:
+    """Send difflib_overlap of two documents and the matching blocks of their report"""
+
+    blocks = None
+    score = difflib_overlap(target_words, source_words)
+    if block_size is not None:
+        # Same blocks as the HTML report, which shows the source first
+        blocks = get_real_matching_blocks(source_words, target_words, block_size)
+    connection.send((score, blocks))
+    connection.close()
+
+
+def overlap_within_deadline(
+    target_words: Sequence,
+    source_words: Sequence,
+    workers: int = 1,
+    deadline: Optional[Deadline] = None,
+    block_size: Optional[int] = None,
+) -> Tuple[float, Optional[list]]:
+    """Return difflib_overlap of two documents, raising DeadlineExceeded if too late
+
+    Long pairs are compared in a process of their own, terminated if deadline
+    expires first. With block_size, that process also returns the matching blocks
+    of their HTML report, which would otherwise be searched in the request thread
+    with no way to stop it. Blocks are None for pairs compared in the thread.
+
+    """
+
+    deadline = deadline or Deadline()
+    if (
+        workers <= 1
+        or deadline.remaining() is None
+        or len(target_words) * len(source_words) < POOL_MIN_WORK
+    ):
+        return difflib_overlap(target_words, source_words), None
+
+    deadline.check()
+    context = get_context("spawn")  # Forking a threaded server process is unsafe
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_compare_documents,
+        args=(sender, target_words, source_words, block_size),
+        daemon=True,
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(deadline.remaining()):
+            raise DeadlineExceeded("Comparison deadline exceeded")
+        return receiver.recv()
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def coverage_percentage(windows: List[Window], total_words: int) -> float:
+    """Return percentage of the total_words words covered by windows"""
+
+    if total_words == 0:
+        return 0.0
+
+    covered, cursor = 0, 0
+    for start, end in sorted(windows):
+        start = max(start, cursor)
+        if end > start:
+            covered += end - start
+            cursor = end
+
+    return round(covered / total_words * 100, 3)
+
+
+def compare_segments(
+    target_words: Sequence,
+    source_documents: List[Sequence],
+    window_size: int = 50,
+    step: int = 25,
+    threshold: float = 50,
+    candidates: int = 3,
+    workers: int = 1,
+    deadline: Optional[Deadline] = None,
+) -> Tuple[List[dict], bool]:
+    """Compare windows of target with windows of every source document
+
+    Each target window is only scored against the candidates windows of each source
+    sharing the most shingles with it, so that sources holding the same text all
+    get scored. Windows scoring at least threshold percent are hits. For every
+    source, return its segment score (percentage of target words inside a hit) and
+    its hits sorted from the most similar, along with True if deadline expired
+    before every window was scored.
+
+    """
+
+    index, source_windows = build_window_index(source_documents, window_size, step)
+    target_windows = split_windows(target_words, window_size, step)
+
+    pairs_positions = []
+    for target_ind, (start, end) in enumerate(target_windows):
+        shared: Dict[int, Counter] = defaultdict(Counter)
+        for shingle in get_shingles(target_words[start:end]):
+            for doc_ind, win_ind in index.get(shingle, ()):
+                shared[doc_ind][win_ind] += 1
+        for doc_ind, windows_shared in shared.items():
+            for win_ind, _ in windows_shared.most_common(candidates):
+                pairs_positions.append((target_ind, (doc_ind, win_ind)))
+
+    pairs = []
+    for target_ind, (doc_ind, win_ind) in pairs_positions:
+        t_start, t_end = target_windows[target_ind]
+        s_start, s_end = source_windows[doc_ind][win_ind]
+        pairs.append(
+            (target_words[t_start:t_end], source_documents[doc_ind][s_start:s_end])
+        )
+    scores = score_pairs(pairs, workers, deadline=deadline)
+
+    hits: List[List[dict]] = [[] for _ in source_documents]
+    for (target_ind, (doc_ind, win_ind)), score in zip(pairs_positions, scores):
+        if score is None or score < threshold:
+            continue
+        t_start, t_end = target_windows[target_ind]
+        s_start, s_end = source_windows[doc_ind][win_ind]
+        hits[doc_ind].append(
+            {
+                "target_start": t_start,
+                "target_end": t_end,
+                "source_start": s_start,
+                "source_end": s_end,
+                "score": score,
+            }
+        )
+
+    results = []
+    for doc_hits in hits:
+        doc_hits.sort(key=lambda hit: hit["score"], reverse=True)
+        covered = [(hit["target_start"], hit["target_end"]) for hit in doc_hits]
+        results.append(
+            {
+                "segment_score": coverage_percentage(covered, len(target_words)),
+                "segments": doc_hits,
+            }
+        )
+
+    return results, None in scores
@@ -0,0 +1,140 @@
+""" This script coordinates comparisons over a corpus split between several servers
+
+Each shard is an instance of this API serving its own part of the source files.
+It sends the target words to the shard scoring endpoint of every shard at once.
+It merges the best results of all shards and stores the merged report.
+
+"""
+
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import path
+from time import perf_counter
+from typing import List, Optional, Tuple
+from urllib import error, request as urlrequest
+
+from scripts.deadline import Deadline
+from scripts.html_utils import writing_results
+
+# Seconds a shard may take to answer after its scoring timeout
+SHARD_ANSWER_DELAY = 10
+
+# Shards are not queried with less scoring time left than this, in seconds
+MIN_SHARD_TIMEOUT = 1
+
+
+def parse_shard_urls(value) -> List[str]:
+    """Return shard base urls from a list or a comma separated string"""
+
+    if isinstance(value, str):
+        value = value.split(",")
+
+    return [url.strip().rstrip("/") for url in value or [] if url.strip()]
+
+
+def query_shard(url: str, words: list, top_k: int, timeout: float) -> dict:
+    """Return scores computed by one shard, or the error it failed with
+
+    The shard is given timeout seconds to score, and a few more to answer.
+
+    """
+
+    start = perf_counter()
+    payload = {"words": words, "top_k": top_k, "timeout": timeout}
+    req = urlrequest.Request(
+        f"{url}/shard/score",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+
+    try:
+        with urlrequest.urlopen(req, timeout=timeout + SHARD_ANSWER_DELAY) as response:
+            body = json.load(response)
+    except (error.URLError, OSError, ValueError) as shard_error:
+        return {"shard": url, "status": "failed", "error": str(shard_error)}
+
+    return {
+        "shard": url,
+        "status": "ok",
+        "compared": body["compared"],
+        "skipped": body["skipped"],
+        "results": body["results"],
+        "elapsed": round(perf_counter() - start, 3),
+    }
+
+
+def fan_out(
+    shard_urls: List[str], words: list, top_k: int, timeout: float
+) -> Tuple[List[dict], List[dict]]:
+    """Query all shards in parallel and return merged top_k results and shard states"""
+
+    with ThreadPoolExecutor(max_workers=len(shard_urls)) as executor:
+        responses = list(
+            executor.map(
+                lambda url: query_shard(url, words, top_k, timeout), shard_urls
+            )
+        )
+
+    candidates = [
+        {"shard": response["shard"], **result}
+        for response in responses
+        if response["status"] == "ok"
+        for result in response["results"]
+    ]
+    merged = heapq.nlargest(
+        top_k, candidates, key=lambda result: result["difflib_score"]
+    )
+    shards = [
+        {key: value for key, value in response.items() if key != "results"}
+        for response in responses
+    ]
+
+    return merged, shards
+
+
+def coordinate(
+    target_file_name: str,
+    words: list,
+    shard_urls: List[str],
+    out_dir: str,
+    top_k: int,
+    timeout: float,
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """Compare target words on every shard and store the merged report
+
+    The merged report gets its own id, the name of its results directory. Merged
+    results have no HTML report, they are identified by their shard and source_id.
+    Shards get at most the time left before deadline, and are all skipped when too
+    little is left. The report is partial when a shard failed, was skipped or
+    skipped sources.
+
+    """
+
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+    if timeout < MIN_SHARD_TIMEOUT:
+        merged, shards = [], [{"shard": url, "status": "skipped"} for url in shard_urls]
+    else:
+        merged, shards = fan_out(shard_urls, words, top_k, timeout)
+
+    report_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    report = {
+        "target_file": target_file_name,
+        "report_id": report_id,
+        "source_files": merged,
+        "shards": shards,
+        "partial": any(
+            shard["status"] != "ok" or shard["skipped"] for shard in shards
+        ),
+    }
+
+    report_path = path.join(writing_results(report_id, out_dir), "report.json")
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file)
+
+    return report
@@ -0,0 +1,66 @@
+""" This script formats comparison results as a stream of records
+
+It writes one record per compared or skipped source file as soon as it is available.
+It ends the stream with a summary record, or an error record if comparison failed.
+It supports newline delimited JSON and Server-Sent Events formats.
+
+"""
+
+import json
+from time import perf_counter
+from typing import Generator, Iterator, List
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def format_record(record: dict, stream_format: str) -> str:
+    """Return record serialized for the given stream format"""
+
+    data = json.dumps(record)
+    if stream_format == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n"
+
+    return data + "\n"
+
+
+def stream_results(
+    target_file_name: str, results: Generator[dict, None, None], stream_format: str
+) -> Iterator[str]:
+    """Yield a result record for each item of results, then a summary record
+
+    The results iterator is closed when the client goes away, which stops the
+    comparison before the next source file.
+
+    """
+
+    start = perf_counter()
+    compared: List[dict] = []
+
+    try:
+        for result in results:
+            compared.append(result)
+            yield format_record({"type": "result", **result}, stream_format)
+    except Exception as error:
+        yield format_record({"type": "error", "error": str(error)}, stream_format)
+    finally:
+        results.close()
+
+    # Sources scored without their HTML report (report_skipped) count as compared
+    scored = [result for result in compared if "difflib_score" in result]
+    yield format_record(
+        {
+            "type": "summary",
+            "target_file": target_file_name,
+            "compared": len(scored),
+            "skipped": len(compared) - len(scored),
+            "partial": any(result["status"] != "completed" for result in compared),
+            "best_match": max(
+                scored, key=lambda result: result["difflib_score"], default=None
+            ),
+            "elapsed": round(perf_counter() - start, 3),
+        },
+        stream_format,
+    )
@@ -0,0 +1,403 @@
+""" This script stores functions for receiving source files in chunks
+
+It keeps resumable upload sessions as partial files in an upload directory.
+It hashes content while chunks are streamed to disk, using bounded memory.
+It detects the file type from magic bytes instead of the file name.
+It moves finished uploads atomically into the source directory and the catalog.
+
+"""
+
+import fcntl
+import hashlib
+import itertools
+import json
+import unicodedata
+import uuid
+import zipfile
+from contextlib import contextmanager
+from os import SEEK_END, fstat, fsync, listdir, makedirs, path, remove, replace, stat
+from threading import Lock
+from time import time
+from typing import IO, Dict, Iterator, Optional, Tuple
+
+from scripts import catalog
+
+BUFFER_SIZE = 64 * 1024
+
+ODT_MIMETYPE = b"application/vnd.oasis.opendocument.text"
+
+# Bytes kept of a file name stem, under the 255 bytes limit of most file systems
+MAX_STEM_BYTES = 200
+
+# Zero width (non-)joiners are part of words in several scripts
+KEPT_FORMAT_CHARACTERS = {"\u200c", "\u200d"}
+
+# Running SHA-256 of in-progress uploads, keyed by upload id, with the offset it
+# has reached. Uploads resumed in another worker are hashed again on completion.
+_hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+_hashers_lock = Lock()
+
+
+class UploadNotFoundError(Exception):
+    """Raised when no upload session exists for the given id."""
+
+    pass
+
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start where the partial file ends."""
+
+    def __init__(self, expected_offset: int):
+        super().__init__(f"Chunk must start at offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+
+class IncompleteUploadError(Exception):
+    """Raised when completing an upload that has not received all its bytes."""
+
+    pass
+
+
+class UnsupportedFileTypeError(Exception):
+    """Raised when uploaded content is not a txt, pdf, docx or odt file."""
+
+    pass
+
+
+def detect_file_type(file_path: str) -> Optional[str]:
+    """Return txt, pdf, docx or odt according to file content, None otherwise"""
+
+    with open(file_path, "rb") as file:
+        head = file.read(8192)
+
+    if not head:
+        return None
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+                if "mimetype" in names and archive.read("mimetype").strip() == (
+                    ODT_MIMETYPE
+                ):
+                    return "odt"
+                if "word/document.xml" in names:
+                    return "docx"
+        except zipfile.BadZipFile:
+            pass
+        return None
+    if b"\x00" in head:
+        return None
+
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as decode_error:
+        # Accept a multi-byte character cut by the end of the sample
+        if decode_error.start < len(head) - 3:
+            return None
+
+    return "txt"
+
+
+def source_file_name(file_name: str, file_type: str) -> str:
+    """Return safe name for the source directory ending with the detected type
+
+    Letters of every script are kept. Directories, control and other invisible
+    characters, and leading or trailing dots and spaces are removed.
+
+    """
+
+    base_name = file_name.replace("\\", "/").rsplit("/", 1)[-1]
+    base_name = "".join(
+        char
+        for char in unicodedata.normalize("NFC", base_name)
+        if unicodedata.category(char)[0] != "C" or char in KEPT_FORMAT_CHARACTERS
+    )
+    stem = path.splitext(base_name)[0].strip(" .")
+    stem = stem.encode("utf-8")[:MAX_STEM_BYTES].decode("utf-8", "ignore").rstrip(" .")
+
+    return f"{stem or 'upload'}.{file_type}"
+
+
+def move_to_sources(tmp_path: str, source_dir: str, file_name: str, sha256: str) -> str:
+    """Move tmp_path into source_dir without replacing any file, return its name
+
+    When file_name is taken, the file is stored as `<stem>-<hash prefix>` instead,
+    followed by a counter if that name is taken too.
+
+    """
+
+    stem, extension = path.splitext(file_name)
+    for attempt in itertools.count():
+        if attempt == 0:
+            final_name = file_name
+        elif attempt == 1:
+            final_name = f"{stem}-{sha256[:8]}{extension}"
+        else:
+            final_name = f"{stem}-{sha256[:8]}-{attempt}{extension}"
+
+        final_path = path.join(source_dir, final_name)
+        try:
+            # Reserve the name atomically, concurrent uploads get another one
+            open(final_path, "x").close()
+        except FileExistsError:
+            continue
+
+        replace(tmp_path, final_path)
+        return final_name
+
+
+def copy_stream(
+    stream: IO[bytes], destination: IO[bytes], digest: Optional["hashlib._Hash"]
+) -> int:
+    """Copy stream into destination by fixed size buffers, return bytes copied"""
+
+    copied = 0
+    for buffer in iter(lambda: stream.read(BUFFER_SIZE), b""):
+        destination.write(buffer)
+        if digest is not None:
+            digest.update(buffer)
+        copied += len(buffer)
+
+    return copied
+
+
+def save_stream(stream: IO[bytes], upload_dir: str) -> Tuple[str, str]:
+    """Write stream to a temporary file in upload_dir, return its path and hash"""
+
+    if not path.exists(upload_dir):
+        makedirs(upload_dir)
+
+    tmp_path = path.join(upload_dir, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    with open(tmp_path, "wb") as tmp_file:
+        copy_stream(stream, tmp_file, digest)
+        tmp_file.flush()
+        fsync(tmp_file.fileno())
+
+    return tmp_path, digest.hexdigest()
+
+
+def commit_to_sources(
+    tmp_path: str, file_name: str, sha256: str, source_dir: str, catalog_path: str
+) -> dict:
+    """Move verified temporary file into source_dir and record it in the catalog
+
+    Content already present in the catalog is not stored twice, the existing entry
+    is returned instead with duplicate set to True.
+
+    """
+
+    file_type = detect_file_type(tmp_path)
+    if file_type is None:
+        remove(tmp_path)
+        raise UnsupportedFileTypeError(
+            f"{file_name} is not a txt, pdf, docx or odt file"
+        )
+
+    existing = catalog.find_by_hash(catalog_path, sha256)
+    if existing is not None:
+        remove(tmp_path)
+        return {
+            "id": existing["id"],
+            "file_name": existing["file_name"],
+            "sha256": sha256,
+            "duplicate": True,
+        }
+
+    file_size = path.getsize(tmp_path)
+    final_name = move_to_sources(
+        tmp_path, source_dir, source_file_name(file_name, file_type), sha256
+    )
+    source_id = catalog.add_source(catalog_path, final_name, file_size, sha256)
+
+    return {
+        "id": source_id,
+        "file_name": final_name,
+        "sha256": sha256,
+        "duplicate": False,
+    }
+
+
+def _session_paths(upload_dir: str, upload_id: str) -> Tuple[str, str]:
+    """Return metadata and partial file paths of upload session"""
+
+    if not upload_id.isalnum():
+        raise UploadNotFoundError(f"Upload {upload_id} not found")
+
+    return (
+        path.join(upload_dir, f"{upload_id}.json"),
+        path.join(upload_dir, f"{upload_id}.part"),
+    )
+
+
+def purge_stale_uploads(upload_dir: str, max_age: float) -> None:
+    """Remove upload sessions untouched for more than max_age seconds"""
+
+    if not path.exists(upload_dir):
+        return
+
+    limit = time() - max_age
+    for file_name in listdir(upload_dir):
+        file_path = path.join(upload_dir, file_name)
+        # Appends only touch the partial file, so sessions age by their .part
+        part_path = path.splitext(file_path)[0] + ".part"
+        if not path.exists(part_path):
+            part_path = file_path
+        try:
+            if path.getmtime(part_path) < limit:
+                remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def create_upload(upload_dir: str, file_name: str, total_size: Optional[int]) -> dict:
+    """Start a new upload session and return its description"""
+
+    if not path.exists(upload_dir):
+        makedirs(upload_dir)
+
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _session_paths(upload_dir, upload_id)
+    metadata = {"file_name": file_name, "total_size": total_size}
+
+    with open(meta_path, "w", encoding="utf-8") as meta_file:
+        json.dump(metadata, meta_file)
+    open(part_path, "wb").close()
+
+    with _hashers_lock:
+        _hashers[upload_id] = (0, hashlib.sha256())
+
+    return {"upload_id": upload_id, "offset": 0, **metadata}
+
+
+def get_upload(upload_dir: str, upload_id: str) -> dict:
+    """Return description of upload session including the bytes received so far"""
+
+    meta_path, part_path = _session_paths(upload_dir, upload_id)
+    try:
+        with open(meta_path, encoding="utf-8") as meta_file:
+            metadata = json.load(meta_file)
+        offset = path.getsize(part_path)
+    except FileNotFoundError:
+        raise UploadNotFoundError(f"Upload {upload_id} not found")
+
+    return {"upload_id": upload_id, "offset": offset, **metadata}
+
+
+@contextmanager
+def locked_part_file(upload_dir: str, upload_id: str) -> Iterator[IO[bytes]]:
+    """Open partial file of upload session with an exclusive lock held until exit
+
+    The lock is shared by every worker process. A session completed or aborted
+    while waiting for the lock is reported as not found.
+
+    """
+
+    meta_path, part_path = _session_paths(upload_dir, upload_id)
+    try:
+        part_file = open(part_path, "r+b")
+    except FileNotFoundError:
+        raise UploadNotFoundError(f"Upload {upload_id} not found")
+
+    with part_file:
+        fcntl.flock(part_file, fcntl.LOCK_EX)
+        try:
+            current = stat(part_path)
+        except FileNotFoundError:
+            current = None
+        if (
+            current is None
+            or current.st_ino != fstat(part_file.fileno()).st_ino
+            or not path.exists(meta_path)
+        ):
+            raise UploadNotFoundError(f"Upload {upload_id} not found")
+
+        yield part_file
+
+
+def append_chunk(
+    upload_dir: str, upload_id: str, offset: int, stream: IO[bytes]
+) -> dict:
+    """Append chunk starting at offset to upload session and return its description
+
+    The partial file stays locked from the offset check to the end of the write, so
+    a retried chunk sent while the first attempt is still writing, possibly to
+    another worker process, gets an offset error instead of being appended twice.
+
+    """
+
+    session = get_upload(upload_dir, upload_id)
+    with locked_part_file(upload_dir, upload_id) as part_file:
+        session["offset"] = fstat(part_file.fileno()).st_size
+        if offset != session["offset"]:
+            raise UploadOffsetError(session["offset"])
+
+        with _hashers_lock:
+            tracked = _hashers.get(upload_id)
+        digest = tracked[1] if tracked and tracked[0] == offset else None
+        if digest is None:
+            with _hashers_lock:
+                _hashers.pop(upload_id, None)
+
+        part_file.seek(0, SEEK_END)
+        received = copy_stream(stream, part_file, digest)
+        part_file.flush()
+        fsync(part_file.fileno())
+
+        session["offset"] += received
+        total_size = session["total_size"]
+        if total_size is not None and session["offset"] > total_size:
+            abort_upload(upload_dir, upload_id)
+            raise IncompleteUploadError(
+                f"Upload {upload_id} exceeded its declared size of {total_size} bytes"
+            )
+
+        if digest is not None:
+            with _hashers_lock:
+                _hashers[upload_id] = (session["offset"], digest)
+
+    return session
+
+
+def complete_upload(
+    upload_dir: str, upload_id: str, source_dir: str, catalog_path: str
+) -> dict:
+    """Validate finished upload and move it into source_dir, return catalog entry"""
+
+    # Locked so that a chunk still being written is not committed half way
+    with locked_part_file(upload_dir, upload_id):
+        session = get_upload(upload_dir, upload_id)
+        total_size = session["total_size"]
+        if total_size is not None and session["offset"] != total_size:
+            raise IncompleteUploadError(
+                f"Upload {upload_id} received {session['offset']} of {total_size} "
+                "bytes"
+            )
+
+        meta_path, part_path = _session_paths(upload_dir, upload_id)
+        with _hashers_lock:
+            tracked = _hashers.pop(upload_id, None)
+        if tracked and tracked[0] == session["offset"]:
+            sha256 = tracked[1].hexdigest()
+        else:
+            sha256 = catalog.file_sha256(part_path)
+
+        try:
+            return commit_to_sources(
+                part_path, session["file_name"], sha256, source_dir, catalog_path
+            )
+        finally:
+            remove(meta_path)
+
+
+def abort_upload(upload_dir: str, upload_id: str) -> None:
+    """Discard upload session and its partial file"""
+
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+    for file_path in _session_paths(upload_dir, upload_id):
+        if path.exists(file_path):
+            remove(file_path)
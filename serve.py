@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+""" This module runs the API server in production mode
+
+It serves the Flask app with gunicorn using several worker processes and threads.
+Every option can also be given with an environment variable, e.g. PLAG_WORKERS=4.
+The app itself keeps reading its settings from PLAG_ prefixed variables (see main.py).
+
+"""
+
+import argparse
+import multiprocessing
+from os import environ
+
+from gunicorn.app.base import BaseApplication
+
+
+class PlagCheckerApplication(BaseApplication):
+    """Gunicorn application loading main.app inside each worker"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+
+        return app
+
+
+def when_ready(server) -> None:
+    """Sync the catalog and start the results sweeper in the gunicorn master
+
+    Workers are forked afterwards, so the sweeper thread runs once for all of them.
+
+    """
+
+    from main import start_background_tasks
+
+    start_background_tasks()
+
+
+def parse_options():
+    """Parse command-line arguments for the production server"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-b",
+        "--bind",
+        type=str,
+        default=environ.get("PLAG_BIND", "0.0.0.0:8000"),
+        help="address to listen on (default=0.0.0.0:8000)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(environ.get("PLAG_WORKERS", multiprocessing.cpu_count())),
+        help="number of worker processes (default=number of CPUs)",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=int(environ.get("PLAG_THREADS", 4)),
+        help="number of threads per worker, keep it above PLAG_EVALUATE_CONCURRENCY plus "
+        "PLAG_UPLOAD_CONCURRENCY so light endpoints always get a thread (default=4)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=int(environ.get("PLAG_WORKER_TIMEOUT", 300)),
+        help="seconds before a silent worker is killed and restarted (default=300)",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=int(environ.get("PLAG_MAX_REQUESTS", 0)),
+        help="restart a worker after this many requests, 0 to disable (default=0)",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_options()
+    PlagCheckerApplication(
+        {
+            "bind": args.bind,
+            "workers": args.workers,
+            "threads": args.threads,
+            "worker_class": "gthread",
+            "timeout": args.timeout,
+            "max_requests": args.max_requests,
+            "max_requests_jitter": args.max_requests // 10,
+            "accesslog": "-",
+            "when_ready": when_ready,
+        }
+    ).run()
@@ -0,0 +1,30 @@
+""" This script tests window by window comparison of documents """
+
+import random
+
+from scripts.segments import compare_segments
+
+
+def random_words(count: int, seed: int) -> list:
+    """Return count random words, the same ones for a given seed"""
+
+    generator = random.Random(seed)
+    return [f"word{generator.randrange(5000)}" for _ in range(count)]
+
+
+def test_duplicate_sources_get_the_same_score():
+    source = random_words(1000, seed=0)
+
+    results, partial = compare_segments(source[:200], [source] * 5, 50, 25, 50)
+
+    assert not partial
+    assert [result["segment_score"] for result in results] == [100.0] * 5
+
+
+def test_unrelated_source_scores_zero():
+    source = random_words(1000, seed=0)
+    unrelated = random_words(1000, seed=1)
+
+    results, _ = compare_segments(source[:200], [unrelated, source], 50, 25, 50)
+
+    assert [result["segment_score"] for result in results] == [0.0, 100.0]